@@ -17,45 +17,43 @@
 from concurrent import futures
 import argparse
 import os
+import signal
 import sys
+import threading
 import time
 import grpc
 import traceback
 from jinja2 import Environment, FileSystemLoader, select_autoescape, TemplateError
 from google.api_core.exceptions import GoogleAPICallError
-from google.auth.exceptions import DefaultCredentialsError
 
 import demo_pb2
 import demo_pb2_grpc
+from grpc_health.v1 import health
 from grpc_health.v1 import health_pb2
 from grpc_health.v1 import health_pb2_grpc
 
-from opentelemetry import trace
-from opentelemetry.instrumentation.grpc import GrpcInstrumentorServer
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-
-import googlecloudprofiler
+# googlecloudprofiler and OpenTelemetry take most of this module's import
+# time, so they are imported when (and only if) they are used
 
+import prefork
+import profiler
+import readiness
 from logger import getJSONLogger
 logger = getJSONLogger('emailservice-server')
 
-# Loads confirmation email template from file
+# Loads confirmation email template from file; it is compiled during warmup
 env = Environment(
     loader=FileSystemLoader('templates'),
     autoescape=select_autoescape(['html', 'xml'])
 )
-template = env.get_template('confirmation.html')
+template = None
+
+def load_template():
+  global template
+  template = env.get_template('confirmation.html')
 
 class BaseEmailService(demo_pb2_grpc.EmailServiceServicer):
-  def Check(self, request, context):
-    return health_pb2.HealthCheckResponse(
-      status=health_pb2.HealthCheckResponse.SERVING)
-  
-  def Watch(self, request, context):
-    return health_pb2.HealthCheckResponse(
-      status=health_pb2.HealthCheckResponse.UNIMPLEMENTED)
+  pass
 
 class EmailService(BaseEmailService):
   def __init__(self):
@@ -80,7 +78,7 @@ class EmailService(BaseEmailService):
         "html_body": content
       }
     )
-    logger.info("Message sent: {}".format(response.rfc822_message_id))
+    logger.info("Message sent: %s", response.rfc822_message_id)
 
   def SendOrderConfirmation(self, request, context):
     email = request.email
@@ -106,7 +104,7 @@ class EmailService(BaseEmailService):
 
 class DummyEmailService(BaseEmailService):
   def SendOrderConfirmation(self, request, context):
-    logger.info('A request to send order confirmation email to {} has been received.'.format(request.email))
+    logger.info('A request to send order confirmation email to %s has been received.', request.email)
     return demo_pb2.Empty()
 
 class HealthCheck():
@@ -115,7 +113,8 @@ class HealthCheck():
       status=health_pb2.HealthCheckResponse.SERVING)
 
 def start(dummy_mode):
-  server = grpc.server(futures.ThreadPoolExecutor(max_workers=10),)
+  server = grpc.server(futures.ThreadPoolExecutor(max_workers=10),
+                       options=[("grpc.so_reuseport", 1)])
   service = None
   if dummy_mode:
     service = DummyEmailService()
@@ -123,19 +122,32 @@ def start(dummy_mode):
     raise Exception('non-dummy mode not implemented yet')
 
   demo_pb2_grpc.add_EmailServiceServicer_to_server(service, server)
-  health_pb2_grpc.add_HealthServicer_to_server(service, server)
+  health_servicer = health.HealthServicer()
+  health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+  ready = readiness.Readiness(
+    ['hipstershop.EmailService'], [lambda: template is not None])
+  ready.serve(health_servicer)
 
   port = os.environ.get('PORT', "8080")
   logger.info("listening on port: "+port)
   server.add_insecure_port('[::]:'+port)
   server.start()
+  startObservability()
+
+  # warm up while health checks report NOT_SERVING
+  load_template()
+  ready.poke()
   try:
     while True:
       time.sleep(3600)
   except KeyboardInterrupt:
-    server.stop(0)
+    ready.stop()
+    # let in-flight calls finish; new calls are refused meanwhile
+    server.stop(prefork.stop_grace()).wait()
 
 def initStackdriverProfiling():
+  import googlecloudprofiler
+
   project_id = None
   try:
     project_id = os.environ["GCP_PROJECT_ID"]
@@ -161,38 +173,69 @@ def initStackdriverProfiling():
   return
 
 
-if __name__ == '__main__':
-  logger.info('starting the email service in dummy mode.')
+def initTracing():
+  """Instruments gRPC; must run before the server is created."""
+  if os.environ.get("ENABLE_TRACING") != "1":
+    logger.info("Tracing disabled.")
+    return
+  try:
+    from opentelemetry.instrumentation.grpc import GrpcInstrumentorServer
+    grpc_server_instrumentor = GrpcInstrumentorServer()
+    grpc_server_instrumentor.instrument()
+  except Exception as e:
+      logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.")
+
+def initTraceExport():
+  from opentelemetry import trace
+  from opentelemetry.sdk.trace import TracerProvider
+  from opentelemetry.sdk.trace.export import BatchSpanProcessor
+  from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+  otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
+  trace.set_tracer_provider(TracerProvider())
+  trace.get_tracer_provider().add_span_processor(
+    BatchSpanProcessor(
+        OTLPSpanExporter(
+        endpoint = otel_endpoint,
+        insecure = True
+      )
+    )
+  )
 
+def initObservability():
+  """Starts the profiler agent and trace export, which may block on the network."""
   # Profiler
-  try:
-    if "DISABLE_PROFILER" in os.environ:
-      raise KeyError()
-    else:
-      logger.info("Profiler enabled.")
-      initStackdriverProfiling()
-  except KeyError:
-      logger.info("Profiler disabled.")
+  if "DISABLE_PROFILER" in os.environ:
+    logger.info("Profiler disabled.")
+  else:
+    logger.info("Profiler enabled.")
+    initStackdriverProfiling()
 
   # Tracing
-  try:
-    if os.environ["ENABLE_TRACING"] == "1":
-      otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
-      trace.set_tracer_provider(TracerProvider())
-      trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            OTLPSpanExporter(
-            endpoint = otel_endpoint,
-            insecure = True
-          )
-        )
-      )
-    grpc_server_instrumentor = GrpcInstrumentorServer()
-    grpc_server_instrumentor.instrument()
+  if os.environ.get("ENABLE_TRACING") == "1":
+    try:
+      initTraceExport()
+    except Exception as e:
+      logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.")
 
-  except (KeyError, DefaultCredentialsError):
-      logger.info("Tracing disabled.")
-  except Exception as e:
-      logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.") 
-  
+def startObservability():
+  """Runs initObservability in the background so it does not delay readiness."""
+  threading.Thread(target=initObservability, name="observability-init", daemon=True).start()
+
+
+def run():
+  profiler.install(logger)
+  initTracing()
   start(dummy_mode = True)
+
+
+if __name__ == '__main__':
+  logger.info('starting the email service in dummy mode.')
+
+  if prefork.enabled():
+    # fork before any gRPC, tracing or profiler state is created
+    prefork.Supervisor(run, prefork.worker_count(), logger).run()
+  else:
+    # stop on SIGTERM through the same path as the prefork workers
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    run()
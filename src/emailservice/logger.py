@@ -14,28 +14,355 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+import collections
+import json
 import logging
+import os
+import queue
 import sys
-from pythonjsonlogger import jsonlogger
+import threading
+import time
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+if orjson is not None:
+  def _dumps(value):
+    return orjson.dumps(value, default=str).decode('utf-8')
+else:
+  _dumps = json.JSONEncoder(default=str).encode
+
+# attributes of every LogRecord; anything else was passed with extra=
+_BASE_RECORD_ATTRS = len(vars(logging.makeLogRecord({})))
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | frozenset(['message', 'asctime'])
 
 # TODO(yoshifumi) this class is duplicated since other Python services are
 # not sharing the modules for logging.
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
-  def add_fields(self, log_record, record, message_dict):
-    super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
-    if not log_record.get('timestamp'):
-      log_record['timestamp'] = record.created
-    if log_record.get('severity'):
-      log_record['severity'] = log_record['severity'].upper()
-    else:
-      log_record['severity'] = record.levelname
+class FastJsonFormatter(logging.Formatter):
+  """Writes one JSON object per record: timestamp, severity, name, message.
+
+  Fields passed with extra= follow, then exc_info if there is one.
+
+  The "severity" and "name" fields are rendered once per (level, logger)
+  and reused; only the timestamp, message and any extra= fields are
+  encoded per record, with orjson when it is installed.
+  """
+
+  def __init__(self):
+    super(FastJsonFormatter, self).__init__()
+    self._prefixes = {}
+
+  def _prefix(self, record):
+    key = (record.levelname, record.name)
+    prefix = self._prefixes.get(key)
+    if prefix is None:
+      prefix = ', "severity": {}, "name": {}, "message": '.format(
+        _dumps(record.levelname.upper()), _dumps(record.name))
+      self._prefixes[key] = prefix
+    return prefix
+
+  def format(self, record):
+    parts = ['{"timestamp": ', repr(record.created), self._prefix(record),
+             _dumps(record.getMessage())]
+    attrs = record.__dict__
+    if len(attrs) > _BASE_RECORD_ATTRS:
+      for key, value in attrs.items():
+        if key not in _RECORD_ATTRS:
+          parts.append(', {}: {}'.format(_dumps(key), _dumps(value)))
+    if record.exc_info:
+      if not record.exc_text:
+        record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      parts.append(', "exc_info": ')
+      parts.append(_dumps(record.exc_text))
+    parts.append('}')
+    return ''.join(parts)
+
+class AsyncStreamHandler(logging.Handler):
+  """Formats and writes records on a background thread.
+
+  emit() only enqueues the record, so request threads never serialize JSON
+  or block on stdout. The writer drains up to batch_size records at a time
+  and writes them with one write and flush. When the bounded queue is full
+  records are dropped and counted, and the writer logs how many were lost.
+  Records are formatted on the writer thread: arguments passed to a log
+  call must not be mutated afterwards.
+
+  emit() takes no lock of its own, so a signal handler that logs cannot
+  deadlock with the thread it interrupted.
+  """
+
+  def __init__(self, stream, capacity=10000, batch_size=256):
+    super(AsyncStreamHandler, self).__init__()
+    self.stream = stream
+    self.capacity = capacity
+    self.batch_size = batch_size
+    # only the writer updates `dropped`; emit() appends to _drops, as
+    # deque.append needs no lock
+    self.dropped = 0
+    self._drops = collections.deque()
+    self._start()
+    # the writer thread does not survive a prefork worker's fork
+    os.register_at_fork(after_in_child=self._start)
+
+  def _start(self):
+    # SimpleQueue.put is reentrant, unlike Queue.put, which takes a lock
+    self._queue = queue.SimpleQueue()
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+    self._thread.start()
+
+  def emit(self, record):
+    if self._queue.qsize() >= self.capacity:
+      self._drops.append(None)
+      return
+    self._queue.put(record)
+
+  def _run(self):
+    q = self._queue
+    while True:
+      batch = [q.get()]
+      while len(batch) < self.batch_size:
+        try:
+          batch.append(q.get_nowait())
+        except queue.Empty:
+          break
+      stop = None in batch
+      lines = []
+      for record in batch:
+        if record is None:
+          continue
+        try:
+          lines.append(self.format(record))
+        except Exception:
+          self.handleError(record)
+      dropped = self._count_drops()
+      if dropped:
+        self.dropped += dropped
+        lines.append(self.format(logging.makeLogRecord({
+          'name': 'logger', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+          'msg': 'dropped %d log records, %d in total' % (dropped, self.dropped)})))
+      if lines:
+        try:
+          self.stream.write('\n'.join(lines) + '\n')
+          self.stream.flush()
+        except Exception:
+          self.handleError(batch[0])
+      if stop:
+        return
+
+  def _count_drops(self):
+    drops = self._drops
+    count = 0
+    while drops:
+      drops.popleft()
+      count += 1
+    return count
+
+  def close(self):
+    """Writes out queued records and stops the writer."""
+    if not self._closed:
+      self._closed = True
+      self._queue.put(None)
+      self._thread.join(timeout=5)
+    super(AsyncStreamHandler, self).close()
+
+class _SamplingRule(object):
+  """Lets 1 in `sample` records through, or `per_second` from a token bucket."""
+
+  def __init__(self, spec):
+    """Raises ValueError unless `spec` is a well-formed rule."""
+    if not isinstance(spec, dict) or not isinstance(spec.get('match'), str):
+      raise ValueError('rule needs a string "match": %r' % (spec,))
+    sample = spec.get('sample', 1)
+    if isinstance(sample, bool) or not isinstance(sample, int) or sample < 1:
+      raise ValueError('"sample" must be a positive integer: %r' % (spec,))
+    per_second = spec.get('per_second')
+    if per_second is not None and (isinstance(per_second, bool) or
+                                   not isinstance(per_second, (int, float)) or
+                                   not 0 <= per_second < float('inf')):
+      raise ValueError('"per_second" must be a non-negative number: %r' % (spec,))
+    self.match = spec['match']
+    self.sample = sample
+    self.per_second = per_second
+    self.logger_name = None
+    self.seen = 0
+    self.suppressed = 0
+    self._tokens = max(1.0, self.per_second or 0)
+    self._updated_at = time.monotonic()
+    self._lock = threading.Lock()
+
+  def allow(self):
+    with self._lock:
+      self.seen += 1
+      if self.per_second is not None:
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.per_second),
+                           self._tokens + (now - self._updated_at) * self.per_second)
+        self._updated_at = now
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return True
+      elif (self.seen - 1) % self.sample == 0:
+        return True
+      self.suppressed += 1
+      return False
+
+  def drain(self):
+    with self._lock:
+      seen, suppressed = self.seen, self.suppressed
+      self.seen = self.suppressed = 0
+      return seen, suppressed
+
+class SamplingFilter(logging.Filter):
+  """Samples or rate limits INFO and DEBUG records per message template.
+
+  Rules match records whose unformatted message (the template, so call
+  sites should log with %-style arguments) starts with `match`, e.g.
+
+    [{"match": "[Recv ListRecommendations]", "sample": 100},
+     {"match": "A request to send order confirmation", "per_second": 5}]
+
+  The rules file is re-read whenever it changes, so rates can be changed at
+  runtime (e.g. by editing a mounted ConfigMap). A file that cannot be read
+  or holds a malformed rule is reported once and the previous rules stay in
+  effect. Every summary_interval seconds, each rule that suppressed records
+  logs how many.
+  """
+
+  _MAX_TEMPLATES = 1000
+
+  def __init__(self, path, reload_interval=10, summary_interval=60):
+    super(SamplingFilter, self).__init__()
+    self._path = path
+    self._reload_interval = reload_interval
+    self._summary_interval = summary_interval
+    self._specs = []
+    self._rules = []
+    self._by_template = {}
+    self._mtime = None
+    self._error = None
+    self.reload()
+    self._start()
+    os.register_at_fork(after_in_child=self._start)
+
+  def _start(self):
+    # rule locks may have been held by another thread at fork time
+    self.set_rules(self._specs)
+    threading.Thread(target=self._run, name='log-sampling', daemon=True).start()
+
+  def set_rules(self, specs):
+    """Replaces the rules; raises ValueError, keeping them, if one is malformed."""
+    if not isinstance(specs, list):
+      raise ValueError('log sampling rules must be a JSON list')
+    rules = [_SamplingRule(spec) for spec in specs]
+    self._specs = list(specs)
+    self._rules = rules
+    self._by_template = {}
+
+  def reload(self):
+    """Re-reads the rules file if it changed."""
+    try:
+      mtime = os.stat(self._path).st_mtime
+      if mtime == self._mtime:
+        return
+      with open(self._path) as f:
+        specs = json.load(f)
+      self.set_rules(specs)
+      self._mtime = mtime
+      self._error = None
+    except (OSError, ValueError) as exc:
+      self._mtime = None
+      if str(exc) != self._error:
+        # retried every reload, but only reported when the problem changes
+        self._error = str(exc)
+        logging.getLogger(__name__).error('Unable to load log sampling rules: %s', exc)
+
+  def _rule_for(self, template):
+    rule = self._by_template.get(template, self)
+    if rule is self:
+      rule = None
+      for candidate in self._rules:
+        if template.startswith(candidate.match):
+          rule = candidate
+          break
+      if len(self._by_template) >= self._MAX_TEMPLATES:
+        self._by_template = {}
+      self._by_template[template] = rule
+    return rule
+
+  def filter(self, record):
+    if record.levelno >= logging.WARNING or not isinstance(record.msg, str):
+      return True
+    rule = self._rule_for(record.msg)
+    if rule is None:
+      return True
+    rule.logger_name = record.name
+    return rule.allow()
+
+  def summarize(self):
+    for rule in self._rules:
+      seen, suppressed = rule.drain()
+      if suppressed and rule.logger_name is not None:
+        logging.getLogger(rule.logger_name).info(
+          'log sampling suppressed %d of %d records matching %r',
+          suppressed, seen, rule.match)
+
+  def _run(self):
+    summarized_at = time.monotonic()
+    while True:
+      time.sleep(self._reload_interval)
+      self.reload()
+      if time.monotonic() - summarized_at >= self._summary_interval:
+        summarized_at = time.monotonic()
+        self.summarize()
+
+_handler = None
+_handler_lock = threading.Lock()
+_sampler = None
+
+def _shared_handler():
+  """One handler per process, so all loggers share one writer thread.
+
+  Set DISABLE_ASYNC_LOGGING to write synchronously on the calling thread.
+  """
+  global _handler
+  with _handler_lock:
+    if _handler is None:
+      if 'DISABLE_ASYNC_LOGGING' in os.environ:
+        _handler = logging.StreamHandler(sys.stdout)
+      else:
+        _handler = AsyncStreamHandler(
+          sys.stdout,
+          int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+          int(os.environ.get('LOG_BATCH_SIZE', '256')))
+        atexit.register(_handler.close)
+      _handler.setFormatter(FastJsonFormatter())
+    return _handler
+
+def _shared_sampler():
+  """The SamplingFilter for LOG_SAMPLING_CONFIG, or None if it is unset."""
+  global _sampler
+  path = os.environ.get('LOG_SAMPLING_CONFIG', '')
+  if not path:
+    return None
+  with _handler_lock:
+    if _sampler is None:
+      _sampler = SamplingFilter(
+        path,
+        float(os.environ.get('LOG_SAMPLING_RELOAD_SECONDS', '10')),
+        float(os.environ.get('LOG_SAMPLING_SUMMARY_SECONDS', '60')))
+    return _sampler
 
 def getJSONLogger(name):
   logger = logging.getLogger(name)
-  handler = logging.StreamHandler(sys.stdout)
-  formatter = CustomJsonFormatter('%(timestamp)s %(severity)s %(name)s %(message)s')
-  handler.setFormatter(formatter)
-  logger.addHandler(handler)
+  logger.addHandler(_shared_handler())
+  sampler = _shared_sampler()
+  if sampler is not None:
+    logger.addFilter(sampler)
   logger.setLevel(logging.INFO)
   logger.propagate = False
   return logger
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-fork supervisor for Python gRPC servers.
+
+The supervisor forks N worker processes that each run their own gRPC server
+bound to the same port with SO_REUSEPORT, so the kernel spreads connections
+across processes and the service is no longer limited to one core by the GIL.
+Workers must not create any gRPC object before the fork, so everything that
+touches gRPC (including tracing and profiling agents) belongs in the worker
+function.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import time
+
+# Shared with workers: [live workers, quorum, draining flag].
+_cluster_state = None
+
+# Workers that die faster than this after starting are restarted with a delay.
+MIN_WORKER_UPTIME_SECONDS = 5
+
+# Time workers get to stop after SIGTERM before the supervisor kills them.
+SHUTDOWN_GRACE_SECONDS = int(os.environ.get("SHUTDOWN_GRACE_SECONDS", "30"))
+
+
+def cgroup_cpu_quota():
+    """Returns the CPU quota of this container rounded up, or None."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def stop_grace():
+    """Grace for server.stop(), leaving workers time to exit before SIGKILL."""
+    return max(0, SHUTDOWN_GRACE_SECONDS - 5)
+
+
+def enabled():
+    return os.environ.get("ENABLE_PREFORK", "0") == "1"
+
+
+def worker_count():
+    """PREFORK_WORKERS if set, else the cgroup CPU quota, else usable CPUs."""
+    configured = os.environ.get("PREFORK_WORKERS", "")
+    if configured:
+        return max(1, int(configured))
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        return quota
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def cluster_serving():
+    """Whether the process group should report SERVING to health checks.
+
+    Always true outside of supervisor mode. Under a supervisor, false while
+    shutting down or when fewer than half of the workers are alive.
+    """
+    state = _cluster_state
+    if state is None:
+        return True
+    return not state[2] and state[0] >= state[1]
+
+
+class Supervisor(object):
+    def __init__(self, target, workers, logger, shutdown_grace=SHUTDOWN_GRACE_SECONDS):
+        global _cluster_state
+        self._target = target
+        self._workers = workers
+        self._logger = logger
+        self._shutdown_grace = shutdown_grace
+        self._children = {}  # pid -> start time
+        self._stopping = False
+        _cluster_state = multiprocessing.RawArray("i", 3)
+        _cluster_state[1] = max(1, math.ceil(workers / 2))
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        # SIGUSR2 would kill the supervisor; pass it on to the workers instead
+        signal.signal(signal.SIGUSR2, self._handle_forward)
+        self._logger.info("starting {} worker processes".format(self._workers))
+        for _ in range(self._workers):
+            self._spawn()
+
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            started = self._children.pop(pid, None)
+            if started is None:
+                continue
+            _cluster_state[0] = len(self._children)
+            if self._stopping:
+                continue
+            self._logger.warning("worker {} exited with status {}, restarting".format(
+                pid, os.waitstatus_to_exitcode(status)))
+            if time.monotonic() - started < MIN_WORKER_UPTIME_SECONDS:
+                time.sleep(1)
+            if not self._stopping:
+                self._spawn()
+        self._logger.info("all workers exited")
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: stop on SIGTERM through the server's KeyboardInterrupt path.
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+            code = 0
+            try:
+                self._target()
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                code = 1
+                self._logger.exception("worker crashed")
+            finally:
+                # os._exit skips atexit: write out queued log records first
+                logging.shutdown()
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+        _cluster_state[0] = len(self._children)
+
+    def _handle_stop(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        _cluster_state[2] = 1
+        self._logger.info("received signal {}, stopping workers".format(signum))
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        signal.signal(signal.SIGALRM, self._handle_grace_expired)
+        signal.alarm(self._shutdown_grace)
+
+    def _handle_forward(self, signum, frame):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _handle_grace_expired(self, signum, frame):
+        for pid in list(self._children):
+            self._logger.warning("worker {} did not stop in time, killing".format(pid))
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
@@ -20,6 +20,7 @@ import logging
 import os
 from imagegenerationservice.imagegenservice import ImageGenerationService
 import demo_pb2
+import profiler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -146,6 +147,15 @@ def get_status(generation_id):
             'status': 'error'
         }), 500
 
+if os.getenv('ENABLE_PROFILE_ENDPOINT') == '1':
+    @app.route('/debug/profile', methods=['GET'])
+    def profile():
+        """Samples all threads for ?seconds= (default 10) and returns collapsed stacks"""
+        seconds = min(float(request.args.get('seconds', '10')), 120)
+        interval = float(os.getenv('PROFILE_INTERVAL_MS', '10')) / 1000
+        stacks = profiler.StackSampler(interval).sample(seconds)
+        return profiler.StackSampler.collapsed(stacks), 200, {'Content-Type': 'text/plain'}
+
 if __name__ == '__main__':
     port = int(os.getenv('HTTP_PORT', '9100'))
     app.run(host='0.0.0.0', port=port, debug=False)
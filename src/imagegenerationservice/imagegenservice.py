@@ -35,6 +35,9 @@ except ImportError:
 import demo_pb2
 import demo_pb2_grpc
 
+import profiler
+import resilience
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -115,6 +118,13 @@ class ImageGenerationService(demo_pb2_grpc.ImageGenerationServiceServicer):
             self.product_stub = ProductCatalogServiceStub(None)
             logger.info("Using stub implementations for local development")
 
+        # Deadlines, retries and a circuit breaker for product lookups, with
+        # the last details seen per product served while the catalog is down
+        self.get_product = resilience.from_environment(
+            "productcatalog", self.product_stub.GetProduct, "PRODUCT_CATALOG", logger)
+        self.known_products = resilience.LastKnownGood(
+            int(os.getenv('PRODUCT_CACHE_SIZE', '1000')))
+
     def GenerateCartImage(self, request, context):
         """Generate an image of cart items with specified style and background"""
         try:
@@ -268,13 +278,29 @@ class ImageGenerationService(demo_pb2_grpc.ImageGenerationServiceServicer):
             logger.error(f"Error getting cart items: {e}")
             return []
 
+    def _get_product(self, product_request):
+        """Get a product, falling back to its last known details"""
+        try:
+            product = self.get_product(product_request)
+        except Exception as e:
+            # NOT_FOUND and the like are real answers, not outages
+            if not resilience.unavailable(e):
+                raise
+            product = self.known_products.get(product_request.id)
+            if product is None:
+                raise
+            logger.warning(f"Using last known details for product {product_request.id}: {e}")
+            return product
+        self.known_products.put(product_request.id, product)
+        return product
+
     def _get_product_details(self, cart_items):
         """Get detailed product information for cart items"""
         product_details = []
         for item in cart_items:
             try:
                 product_request = demo_pb2.GetProductRequest(id=item.product_id)
-                product = self.product_stub.GetProduct(product_request)
+                product = self._get_product(product_request)
                 product_details.append({
                     'id': product.id,
                     'name': product.name,
@@ -454,6 +480,7 @@ def serve():
     
     logger.info(f"Starting ImageGenerationService on port {port}")
     server.start()
+    profiler.install(logger)
     
     # Optionally start MCP/A2A adapter on a different port
     # Uncomment to enable
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-demand sampling profiler that needs no network access.
+
+Sending SIGUSR2 to a process starts a background thread that samples the
+stack of every other thread with sys._current_frames() every
+PROFILE_INTERVAL_MS (default 10) for PROFILE_SECONDS (default 30). The
+result is written in collapsed-stack format, one "thread;frame;frame count"
+line per distinct stack, to PROFILE_DIR/profile-<pid>-<time>.txt, ready for
+flamegraph.pl or speedscope. A second signal while profiling is ignored.
+
+    kubectl exec <pod> -- kill -USR2 1
+"""
+
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+
+def _frame_name(code):
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+class StackSampler(object):
+    def __init__(self, interval=0.01, output_dir="/tmp", logger=None):
+        self._interval = interval
+        self._output_dir = output_dir
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._running = False
+
+    def sample(self, duration):
+        """Samples all other threads for `duration` seconds; returns a Counter of stacks."""
+        stacks = collections.Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self._interval)
+        return stacks
+
+    @staticmethod
+    def collapsed(stacks):
+        return "".join("{} {}\n".format(stack, count) for stack, count in stacks.most_common())
+
+    def start(self, duration):
+        """Profiles in the background; returns False if already profiling."""
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        threading.Thread(
+            target=self._run, args=(duration,), name="stack-sampler", daemon=True).start()
+        return True
+
+    def _run(self, duration):
+        try:
+            stacks = self.sample(duration)
+            path = os.path.join(self._output_dir, "profile-{}-{}.txt".format(
+                os.getpid(), time.strftime("%Y%m%dT%H%M%S")))
+            with open(path, "w") as f:
+                f.write(self.collapsed(stacks))
+            if self._logger is not None:
+                self._logger.info("wrote %d samples to %s", sum(stacks.values()), path)
+        except Exception as exc:
+            if self._logger is not None:
+                self._logger.warning("Stack sampling failed: %s", exc)
+        finally:
+            with self._lock:
+                self._running = False
+
+
+def install(logger, signum=signal.SIGUSR2):
+    """Profiles on `signum`; must be called from the main thread."""
+    sampler = StackSampler(
+        float(os.environ.get("PROFILE_INTERVAL_MS", "10")) / 1000,
+        os.environ.get("PROFILE_DIR", "/tmp"), logger)
+    duration = float(os.environ.get("PROFILE_SECONDS", "30"))
+
+    def handle(signum, frame):
+        if sampler.start(duration):
+            logger.info("profiling for %.0f seconds", duration)
+
+    signal.signal(signum, handle)
+    return sampler
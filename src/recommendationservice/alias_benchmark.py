@@ -0,0 +1,54 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shows that alias-table draws cost the same at any catalog size.
+
+Compares AliasTable.sample with random.choices, which rebuilds cumulative
+weights on every call. Usage: python alias_benchmark.py [iterations]
+"""
+
+import random
+import sys
+import time
+import timeit
+
+from popularity import AliasTable
+
+K = 5
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print("{:>10} {:>12} {:>20} {:>22}".format(
+        "catalog", "build (s)", "alias sample (us/op)", "random.choices (us/op)"))
+    for size in (1000, 100000, 1000000):
+        ids = ["P{:09d}".format(i) for i in range(size)]
+        weights = [random.paretovariate(1.2) for _ in range(size)]
+        started = time.perf_counter()
+        table = AliasTable(ids, weights)
+        build = time.perf_counter() - started
+
+        alias = timeit.timeit(lambda: table.sample(K), number=iterations) / iterations
+        choices_iterations = max(1, iterations // 100)
+        choices = timeit.timeit(
+            lambda: random.choices(ids, weights, k=K),
+            number=choices_iterations) / choices_iterations
+        print("{:>10} {:>12.2f} {:>20.2f} {:>22.2f}".format(
+            size, build, alias * 1e6, choices * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inverted-file (IVF) approximate nearest-neighbour index.
+
+Product vectors are clustered with spherical k-means and stored grouped by
+cluster, so every inverted list is one contiguous slice of the vector
+matrix. A query scores the centroids, then only the `nprobe` closest lists;
+raising nprobe trades latency for recall.
+
+Build an index from a content model (see content.py):
+
+    python ann.py --content content.bin --output ann.bin --nlist 256
+"""
+
+import argparse
+
+import numpy as np
+
+import modelfile
+from content import ContentModel
+from strategies import ScoredStrategy
+
+KIND = "ivf"
+
+
+def _assign(vectors, centroids, batch=65536):
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        scores = vectors[start:start + batch] @ centroids.T
+        assignment[start:start + batch] = np.argmax(scores, axis=1)
+    return assignment
+
+
+def kmeans(vectors, nlist, iterations=10, seed=0):
+    """Spherical k-means; returns (unit centroids, assignment of every row)."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # reseed empty clusters with random vectors
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms[empty] = 1
+        centroids = sums / norms
+    return centroids, _assign(vectors, centroids)
+
+
+class IVFIndex(ContentModel):
+    """A ContentModel whose rows are grouped by inverted list."""
+
+    def __init__(self, product_ids, vectors, centroids, list_offsets, nprobe=8):
+        super().__init__(product_ids, vectors)
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, product_ids, vectors, nlist, iterations=10):
+        centroids, assignment = kmeans(vectors, nlist, iterations)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=len(centroids))
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls([product_ids[i] for i in order], vectors[order], centroids, list_offsets)
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        meta, arrays = modelfile.read(path)
+        if meta.get("kind") != KIND:
+            raise ValueError("{} is not an IVF index".format(path))
+        index = cls(meta["product_ids"], arrays["vectors"], arrays["centroids"],
+                    arrays["list_offsets"], nprobe)
+        if len(index.list_offsets) != len(index.centroids) + 1 or \
+                int(index.list_offsets[-1]) != len(index.product_ids) or \
+                index.vectors.shape[0] != len(index.product_ids):
+            raise ValueError("{}: inconsistent index arrays".format(path))
+        return index
+
+    def save(self, path):
+        modelfile.write(
+            path,
+            {"kind": KIND, "product_ids": list(self.product_ids)},
+            {"vectors": self.vectors, "centroids": self.centroids,
+             "list_offsets": self.list_offsets})
+
+    def search(self, query, k, nprobe=None, exclude=()):
+        """Returns up to k (row, score) pairs for a normalized query vector."""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = self.list_offsets
+        rows = np.concatenate([np.arange(offsets[c], offsets[c + 1]) for c in probed])
+        # lists are contiguous, so scoring reads len(rows) vectors sequentially
+        scores = np.concatenate(
+            [self.vectors[offsets[c]:offsets[c + 1]] @ query for c in probed])
+        if len(exclude):
+            keep = ~np.isin(rows, exclude)
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) == 0:
+            return []
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def top_k(self, product_ids, k, nprobe=None):
+        query, rows = self.query_vector(product_ids)
+        if query is None or k <= 0:
+            return []
+        found = self.search(query, k, nprobe, exclude=rows)
+        return [(self.product_ids[row], score) for row, score in found if score > 0]
+
+
+class ANNStrategy(ScoredStrategy):
+    name = "ann"
+
+    def __init__(self, index):
+        self.index = index
+
+    def candidates(self, product_ids, n):
+        return self.index.top_k(product_ids, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an IVF index from a content model.")
+    parser.add_argument("--content", required=True, help="model written by content.py")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--nlist", type=int, default=256, help="number of inverted lists")
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    model = ContentModel.load(args.content)
+    index = IVFIndex.build(model.product_ids, np.asarray(model.vectors), args.nlist,
+                           args.iterations)
+    index.save(args.output)
+    print("wrote {} vectors in {} lists to {}".format(
+        len(index.product_ids), len(index.centroids), args.output))
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reports recall@5 and latency of IVFIndex against exact search.
+
+Usage: python ann_benchmark.py [--products N] [--dim D] [--nlist L]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+
+K = 5
+
+
+def clustered_vectors(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)]
+    vectors += 1.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_us(samples, q):
+    return np.percentile(samples, q) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--nlist", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    vectors = clustered_vectors(args.products, args.dim, 1000, rng)
+    started = time.perf_counter()
+    index = IVFIndex.build(["P{}".format(i) for i in range(args.products)], vectors, args.nlist)
+    print("built {} lists over {} x {} vectors in {:.1f}s".format(
+        args.nlist, args.products, args.dim, time.perf_counter() - started))
+
+    queries = index.vectors[rng.integers(0, args.products, args.queries)]
+    exact = []
+    exact_latency = []
+    for query in queries:
+        started = time.perf_counter()
+        scores = index.vectors @ query
+        best = np.argpartition(-scores, K - 1)[:K]
+        exact_latency.append(time.perf_counter() - started)
+        exact.append(set(best.tolist()))
+    print("{:>8} {:>10} {:>10} {:>10}".format("nprobe", "recall@5", "p50 (us)", "p99 (us)"))
+    print("{:>8} {:>10.3f} {:>10.0f} {:>10.0f}".format(
+        "exact", 1.0, percentile_us(exact_latency, 50), percentile_us(exact_latency, 99)))
+
+    for nprobe in (1, 4, 8, 16, 64):
+        hits = 0
+        latency = []
+        for query, truth in zip(queries, exact):
+            started = time.perf_counter()
+            found = index.search(query, K, nprobe)
+            latency.append(time.perf_counter() - started)
+            hits += len(truth.intersection(row for row, _ in found))
+        print("{:>8} {:>10.3f} {:>10.0f} {:>10.0f}".format(
+            nprobe, hits / (K * len(queries)),
+            percentile_us(latency, 50), percentile_us(latency, 99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Versioned recommendation artifacts with zero-downtime reloads.
+
+The artifact directory holds one sub-directory per version and a CURRENT
+file naming the active one:
+
+    artifacts/
+      CURRENT            -> "2024-06-01T10-00"
+      2024-06-01T10-00/
+        cooccurrence.bin
+        content.bin
+
+Publishers write a complete version directory first, then atomically replace
+CURRENT (write a temp file and rename it). The server polls CURRENT, loads
+and validates the new version in the background, and swaps it in by
+replacing one reference. A version that fails validation is retried as soon
+as its files change, and otherwise after a backoff, in case it was read
+mid-write or something it depends on was briefly unavailable. Requests lease
+the version they started with; a retired version is released once its last
+lease ends.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+CURRENT_FILE = "CURRENT"
+
+# retries of a rejected, unchanged version back off up to this many polls
+MAX_RETRY_POLLS = 32
+
+
+def fingerprint(models_dir):
+    """Returns the names, sizes and mtimes of the files in models_dir."""
+    try:
+        entries = list(os.scandir(models_dir))
+        return tuple(sorted(
+            (e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in entries))
+    except OSError:
+        return None
+
+
+class ArtifactSet(object):
+    """The strategy built from one artifact version, plus its lease count."""
+
+    def __init__(self, version, strategy):
+        self.version = version
+        self.strategy = strategy
+        self.leases = 0
+        self.retired = False
+
+    def release(self):
+        # drop model references so their memory maps can be unmapped
+        self.strategy = None
+
+
+class ArtifactStore(object):
+    def __init__(self, root, build, logger, poll_interval=30, clock=time.monotonic):
+        """`build(models_dir)` loads and returns a strategy; it must raise
+        if the artifacts in models_dir are missing or invalid."""
+        self._root = root
+        self._build = build
+        self._logger = logger
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._active = None
+        self._clock = clock
+        # (version, fingerprint) of the last rejected version, when to retry
+        # it unchanged, and the backoff that led there
+        self._rejected = None
+        self._retry_at = 0
+        self._retry_backoff = 0
+        self._stopped = threading.Event()
+        self._reloads = REGISTRY.counter("artifact_reloads_total")
+        self._reload_failures = REGISTRY.counter("artifact_reload_failures_total")
+        REGISTRY.gauge("artifact_active_version", fn=self.version)
+
+    def version(self):
+        active = self._active
+        return active.version if active is not None else None
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Yields the active strategy and keeps its version alive meanwhile."""
+        with self._lock:
+            active = self._active
+            active.leases += 1
+        try:
+            yield active.strategy
+        finally:
+            with self._lock:
+                active.leases -= 1
+                drained = active.retired and active.leases == 0
+            if drained:
+                self._release(active)
+
+    def start(self):
+        """Loads the current version, then polls for new ones in the background.
+
+        Raises if the initial version cannot be loaded: serving without the
+        configured models would silently change recommendations.
+        """
+        if not self.poll():
+            raise RuntimeError("no valid artifact version in " + self._root)
+        thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        """Loads and activates CURRENT if it changed. Returns True if a version is active."""
+        try:
+            with open(os.path.join(self._root, CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except OSError as exc:
+            self._logger.warning("Unable to read artifact version: " + str(exc))
+            return self._active is not None
+
+        if version == self.version():
+            return self._active is not None
+        models_dir = os.path.join(self._root, version)
+        rejected = (version, fingerprint(models_dir))
+        if rejected == self._rejected and self._clock() < self._retry_at:
+            return self._active is not None
+        try:
+            if not version or os.path.dirname(os.path.normpath(models_dir)) != \
+                    os.path.normpath(self._root):
+                raise ValueError("invalid version name {!r}".format(version))
+            loaded = ArtifactSet(version, self._build(models_dir))
+        except Exception as exc:
+            self._reject(rejected)
+            self._reload_failures.inc()
+            self._logger.error("Rejected artifact version {}: {}".format(version, exc))
+            return self._active is not None
+
+        self._rejected = None
+        self._swap(loaded)
+        return True
+
+    def _reject(self, rejected):
+        if rejected == self._rejected:
+            self._retry_backoff = min(
+                2 * self._retry_backoff, MAX_RETRY_POLLS * self._poll_interval)
+        else:
+            self._rejected = rejected
+            self._retry_backoff = self._poll_interval
+        self._retry_at = self._clock() + self._retry_backoff
+
+    def _swap(self, loaded):
+        with self._lock:
+            previous = self._active
+            self._active = loaded
+            drained = False
+            if previous is not None:
+                previous.retired = True
+                drained = previous.leases == 0
+        self._reloads.inc()
+        self._logger.info("Activated artifact version " + loaded.version)
+        if drained:
+            self._release(previous)
+
+    def _release(self, artifact_set):
+        artifact_set.release()
+        self._logger.info("Released artifact version " + artifact_set.version)
+
+    def _run(self):
+        while not self._stopped.wait(self._poll_interval):
+            self.poll()
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from artifacts import ArtifactStore
+from logger import getJSONLogger
+
+logger = getJSONLogger('recommendationservice-test')
+
+
+class Model(object):
+    def __init__(self, models_dir):
+        with open(os.path.join(models_dir, "model.txt")) as f:
+            self.name = f.read()
+
+
+def publish(root, version, content=None):
+    models_dir = os.path.join(str(root), version)
+    os.makedirs(models_dir, exist_ok=True)
+    if content is not None:
+        with open(os.path.join(models_dir, "model.txt"), "w") as f:
+            f.write(content)
+    with open(os.path.join(str(root), "CURRENT.tmp"), "w") as f:
+        f.write(version)
+    os.replace(os.path.join(str(root), "CURRENT.tmp"), os.path.join(str(root), "CURRENT"))
+
+
+def test_swap_leaves_in_flight_requests_on_their_version(tmp_path):
+    publish(tmp_path, "v1", "one")
+    store = ArtifactStore(str(tmp_path), Model, logger)
+    assert store.poll()
+
+    with store.acquire() as old:
+        publish(tmp_path, "v2", "two")
+        assert store.poll()
+        assert store.version() == "v2"
+        # the in-flight request keeps its model
+        assert old.name == "one"
+        with store.acquire() as new:
+            assert new.name == "two"
+
+
+def test_retired_version_is_released_after_its_last_lease(tmp_path):
+    publish(tmp_path, "v1", "one")
+    store = ArtifactStore(str(tmp_path), Model, logger)
+    store.poll()
+    first = store._active
+
+    with store.acquire():
+        publish(tmp_path, "v2", "two")
+        store.poll()
+        assert first.retired and first.strategy is not None
+    assert first.strategy is None
+
+
+def test_rejected_version_is_retried_once_its_files_change(tmp_path):
+    publish(tmp_path, "v1", "one")
+    store = ArtifactStore(str(tmp_path), Model, logger, poll_interval=3600)
+    store.poll()
+
+    publish(tmp_path, "v2")
+    assert store.poll()
+    assert store.version() == "v1"
+
+    publish(tmp_path, "v2", "two")
+    store.poll()
+    assert store.version() == "v2"
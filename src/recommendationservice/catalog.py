@@ -0,0 +1,185 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process snapshot of the product catalog.
+
+Requests read whatever snapshot is current and never wait for a refresh; a
+background thread fetches the catalog on an interval and swaps the snapshot
+reference in one assignment. If a refresh fails, the previous snapshot keeps
+being served (stale-while-revalidate).
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+
+from category_index import CategoryIndex
+from metrics import REGISTRY
+from sampling import ProductIndex
+
+
+class CatalogSnapshot(object):
+    """An immutable view of the catalog at the time it was fetched."""
+
+    __slots__ = ("products", "product_ids", "index", "categories", "version", "fetched_at")
+
+    def __init__(self, products, fetched_at=None):
+        self.products = tuple(products)
+        self.product_ids = tuple(p.id for p in self.products)
+        self.index = ProductIndex(self.product_ids)
+        self.categories = CategoryIndex(self.products)
+        digest = hashlib.sha1()
+        for product_id in self.product_ids:
+            digest.update(product_id.encode("utf-8"))
+            digest.update(b"\0")
+        self.version = digest.hexdigest()[:16]
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class CatalogCache(object):
+    """Keeps a CatalogSnapshot fresh using `fetch`.
+
+    `fetch` is a callable returning an iterable of demo_pb2.Product; it is
+    only ever called from the refresh thread, or once from a request thread
+    if no snapshot could be loaded at startup. It may be None when the cache
+    is driven by an AsyncCatalogRefresher instead.
+    """
+
+    def __init__(self, fetch, refresh_interval, logger):
+        self._fetch = fetch
+        self._refresh_interval = refresh_interval
+        self._logger = logger
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._refresh_failures = REGISTRY.counter("catalog_refresh_failures_total")
+        REGISTRY.gauge("catalog_snapshot_age_seconds", fn=self.age)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Nothing to serve yet: load once, letting concurrent callers
+            # share the result instead of issuing their own fetch.
+            with self._load_lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self.refresh()
+        return snapshot
+
+    def current(self):
+        """Returns the current snapshot, or None if none was loaded yet."""
+        return self._snapshot
+
+    def refresh(self):
+        snapshot = CatalogSnapshot(self._fetch())
+        self._snapshot = snapshot
+        return snapshot
+
+    def install(self, snapshot):
+        """Replaces the current snapshot with one fetched elsewhere."""
+        self._snapshot = snapshot
+
+    def refresh_failed(self, exc):
+        self._refresh_failures.inc()
+        self._logger.warning(
+            "Catalog refresh failed, current snapshot age {:.1f}s: {}".format(
+                self.age(), exc))
+
+    def age(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return -1
+        return snapshot.age()
+
+    def start(self):
+        """Loads the first snapshot and starts the background refresher."""
+        try:
+            self.refresh()
+            self._logger.info("loaded catalog snapshot with {} products".format(
+                len(self._snapshot.product_ids)))
+        except Exception as exc:
+            self.refresh_failed(exc)
+        self._thread = threading.Thread(
+            target=self._run, name="catalog-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._refresh_interval):
+            try:
+                self.refresh()
+            except Exception as exc:
+                self.refresh_failed(exc)
+
+
+class AsyncCatalogRefresher(object):
+    """Keeps a CatalogCache fresh from an asyncio event loop.
+
+    Used by the grpc.aio server: `fetch` is a coroutine function returning an
+    iterable of demo_pb2.Product, so fetches never occupy a thread. Building
+    the snapshot from the fetched products runs in a worker thread.
+    """
+
+    def __init__(self, cache, fetch, refresh_interval, logger):
+        self._cache = cache
+        self._fetch = fetch
+        self._refresh_interval = refresh_interval
+        self._logger = logger
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    async def refresh(self):
+        products = await self._fetch()
+        # indexing is O(catalog); keep it off the loop serving requests
+        snapshot = await asyncio.to_thread(CatalogSnapshot, products)
+        self._cache.install(snapshot)
+        return snapshot
+
+    async def load(self):
+        """Returns the current snapshot, fetching it once if there is none."""
+        async with self._load_lock:
+            snapshot = self._cache.current()
+            if snapshot is None:
+                snapshot = await self.refresh()
+            return snapshot
+
+    async def start(self):
+        try:
+            snapshot = await self.refresh()
+            self._logger.info("loaded catalog snapshot with {} products".format(
+                len(snapshot.product_ids)))
+        except Exception as exc:
+            self._cache.refresh_failed(exc)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:
+                self._cache.refresh_failed(exc)
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Category-aware recommendations from a per-snapshot inverted index.
+
+The index maps each category to a compact array of catalog positions and is
+built once per catalog snapshot. A request looks up the categories of the
+products it names and draws from the union of their posting lists without
+materializing it, so the cost depends on k, not on catalog or category size.
+"""
+
+import bisect
+import random
+from array import array
+
+
+class CategoryIndex(object):
+    __slots__ = ("postings", "categories")
+
+    def __init__(self, products):
+        postings = {}
+        categories = []
+        for position, product in enumerate(products):
+            product_categories = tuple(sorted(set(c.lower() for c in product.categories)))
+            categories.append(product_categories)
+            for category in product_categories:
+                postings.setdefault(category, array("i")).append(position)
+        self.postings = postings
+        # position -> tuple of category names
+        self.categories = tuple(categories)
+
+    def shared_postings(self, positions):
+        """Returns the posting lists of every category of the given positions."""
+        seen = set()
+        lists = []
+        for position in positions:
+            for category in self.categories[position]:
+                if category not in seen:
+                    seen.add(category)
+                    lists.append(self.postings[category])
+        return lists
+
+
+class CategoryStrategy(object):
+    """Draws from categories shared with the requested products."""
+
+    name = "category"
+
+    def recommend(self, snapshot, product_ids, k, rng=random):
+        excluded = snapshot.index.excluded_positions(product_ids)
+        lists = snapshot.categories.shared_postings(excluded)
+        if not lists or k <= 0:
+            return []
+        ends = []
+        total = 0
+        for postings in lists:
+            total += len(postings)
+            ends.append(total)
+
+        if total <= 4 * k:
+            # small union: take it whole
+            candidates = {p for postings in lists for p in postings} - excluded
+            picked = sorted(candidates)
+            rng.shuffle(picked)
+            picked = picked[:k]
+        else:
+            # large union: sample the virtual concatenation of the posting
+            # lists and reject repeats; attempts are bounded by k
+            picked = []
+            seen = set(excluded)
+            for _ in range(4 * k + len(excluded)):
+                i = rng.randrange(total)
+                which = bisect.bisect_right(ends, i)
+                start = ends[which - 1] if which else 0
+                position = lists[which][i - start]
+                if position not in seen:
+                    seen.add(position)
+                    picked.append(position)
+                    if len(picked) == k:
+                        break
+        ids = snapshot.index.ids
+        return [ids[p] for p in picked]
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Adaptive concurrency limiting for the gRPC server.
+
+A server interceptor admits a unary call only while fewer than `limit`
+calls are in flight, and fails the rest with RESOURCE_EXHAUSTED without
+deserializing or running them, so overload turns into cheap rejections
+rather than a growing queue. The limit adapts to observed latency:
+
+- aimd: grows by one while latency stays under a target, and shrinks
+  multiplicatively when it doesn't or a call runs out of deadline.
+- gradient: compares short-term latency with a long-term baseline and
+  scales the limit by their ratio, plus a small queue allowance.
+
+Calls are admitted when they arrive, before the sync server queues them for
+a worker thread, so time spent waiting for a worker counts as latency. The
+sync server still sends a rejection from a worker thread, behind the calls
+already queued, so its limit is capped at the number of workers: admitted
+calls never wait for a worker, and a rejection waits for at most one of
+them. Calls beyond GRPC_MAX_CONCURRENT_RPCS are refused by gRPC itself as
+they arrive. A call's slot is released when its handler returns; one whose
+handler never starts, because the call was cancelled while queued, is
+reclaimed after CONCURRENCY_MAX_QUEUE_SECONDS.
+
+Health checks are never limited, so a busy server is not restarted by its
+probes.
+"""
+
+import collections
+import contextlib
+import math
+import os
+import threading
+import time
+
+import grpc
+
+from metrics import REGISTRY
+
+EXEMPT_PREFIX = "/grpc.health.v1.Health/"
+REJECTED = "concurrency limit reached"
+
+
+class AIMDLimit(object):
+    def __init__(self, initial=10, min_limit=1, max_limit=200, backoff=0.9, target=0.1):
+        self.initial = initial
+        self._min = min_limit
+        self._max = max_limit
+        self._backoff = backoff
+        self._target = target
+
+    def update(self, limit, rtt, inflight, dropped):
+        if dropped or rtt > self._target:
+            return max(self._min, limit * self._backoff)
+        if inflight * 2 >= limit:
+            # only grow a limit that is actually being used
+            return min(self._max, limit + 1)
+        return limit
+
+
+class GradientLimit(object):
+    def __init__(self, initial=10, min_limit=1, max_limit=200, smoothing=0.2,
+                 tolerance=1.5, short_window=10, long_window=600):
+        self.initial = initial
+        self._min = min_limit
+        self._max = max_limit
+        self._smoothing = smoothing
+        self._tolerance = tolerance
+        self._short_window = short_window
+        self._long_window = long_window
+        self._short_rtt = None
+        self._long_rtt = None
+
+    def update(self, limit, rtt, inflight, dropped):
+        if self._long_rtt is None:
+            self._short_rtt = self._long_rtt = rtt
+        else:
+            self._short_rtt += (rtt - self._short_rtt) / self._short_window
+            self._long_rtt += (rtt - self._long_rtt) / self._long_window
+            if self._long_rtt / self._short_rtt > 2:
+                # latency recovered well below the baseline: let it follow
+                self._long_rtt *= 0.95
+        if dropped:
+            return max(self._min, limit * 0.9)
+        if inflight * 2 < limit:
+            return limit
+        gradient = max(0.5, min(1.0, self._tolerance * self._long_rtt / self._short_rtt))
+        target = limit * gradient + math.sqrt(limit)
+        limit = limit * (1 - self._smoothing) + target * self._smoothing
+        return max(self._min, min(self._max, limit))
+
+
+class ConcurrencyLimiter(object):
+    def __init__(self, algorithm, max_queue_time=10):
+        """Permits not started within `max_queue_time` seconds are reclaimed."""
+        self._algorithm = algorithm
+        self._max_queue_time = max_queue_time
+        self._lock = threading.Lock()
+        self.limit = float(algorithm.initial)
+        self.inflight = 0
+        self._queued = collections.deque()  # permits in order of admission
+        self._rejected = REGISTRY.counter("concurrency_rejected_total")
+        self._reclaimed = REGISTRY.counter("concurrency_reclaimed_total")
+        REGISTRY.gauge("concurrency_limit", fn=lambda: int(self.limit))
+        REGISTRY.gauge("concurrency_inflight", fn=lambda: self.inflight)
+
+    def try_acquire(self):
+        """Returns a Permit for a new call, or None if the limit is reached."""
+        now = time.monotonic()
+        with self._lock:
+            self._reclaim(now)
+            if self.inflight >= int(self.limit):
+                self._rejected.inc()
+                return None
+            self.inflight += 1
+            permit = Permit(self, now)
+            self._queued.append(permit)
+            return permit
+
+    def release(self, permit, dropped=False):
+        with self._lock:
+            self._release(permit, time.monotonic(), dropped)
+
+    def _release(self, permit, now, dropped):
+        if permit.released:
+            return
+        permit.released = True
+        inflight = self.inflight
+        self.inflight -= 1
+        self.limit = self._algorithm.update(self.limit, now - permit.start, inflight, dropped)
+
+    def _reclaim(self, now):
+        # a permit whose handler never starts belongs to a call that was
+        # cancelled while queued or refused by the server's own limit
+        queued = self._queued
+        while queued:
+            permit = queued[0]
+            if not (permit.started or permit.released):
+                if now - permit.start < self._max_queue_time:
+                    return
+                self._release(permit, now, True)
+                self._reclaimed.inc()
+            queued.popleft()
+
+
+def _deadline_exceeded(context):
+    remaining = context.time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+class Permit(object):
+    """An admitted call's slot, timed from the call's arrival."""
+
+    __slots__ = ("_limiter", "start", "started", "released")
+
+    def __init__(self, limiter, start):
+        self._limiter = limiter
+        self.start = start
+        self.started = False
+        self.released = False
+
+    @contextlib.contextmanager
+    def held(self, context):
+        """Runs the call's handler, releasing the slot when it returns."""
+        self.started = True
+        try:
+            yield
+        finally:
+            self._limiter.release(self, _deadline_exceeded(context))
+
+
+def _limitable(handler, handler_call_details):
+    return (handler is not None and handler.unary_unary is not None
+            and not handler_call_details.method.startswith(EXEMPT_PREFIX))
+
+
+def _reject(request, context):
+    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, REJECTED)
+
+
+async def _reject_async(request, context):
+    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, REJECTED)
+
+
+class ConcurrencyLimitInterceptor(grpc.ServerInterceptor):
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    def intercept_service(self, continuation, handler_call_details):
+        # runs on the server's polling thread as the call arrives
+        handler = continuation(handler_call_details)
+        if not _limitable(handler, handler_call_details):
+            return handler
+        permit = self._limiter.try_acquire()
+        if permit is None:
+            # the request is not even deserialized
+            return grpc.unary_unary_rpc_method_handler(_reject)
+        behavior = handler.unary_unary
+
+        def limited(request, context):
+            with permit.held(context):
+                return behavior(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            limited, handler.request_deserializer, handler.response_serializer)
+
+
+class AsyncConcurrencyLimitInterceptor(grpc.aio.ServerInterceptor):
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if not _limitable(handler, handler_call_details):
+            return handler
+        permit = self._limiter.try_acquire()
+        if permit is None:
+            return grpc.unary_unary_rpc_method_handler(_reject_async)
+        behavior = handler.unary_unary
+
+        async def limited(request, context):
+            with permit.held(context):
+                return await behavior(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            limited, handler.request_deserializer, handler.response_serializer)
+
+
+ALGORITHMS = {
+    "aimd": AIMDLimit,
+    "gradient": GradientLimit,
+}
+
+
+def from_environment(default_initial, max_workers=None):
+    """Returns a ConcurrencyLimiter, or None when CONCURRENCY_LIMITER is unset.
+
+    CONCURRENCY_LIMITER selects "aimd" or "gradient". The limit stays within
+    [CONCURRENCY_LIMIT_MIN, CONCURRENCY_LIMIT_MAX (200)] and starts at
+    CONCURRENCY_LIMIT_INITIAL, by default `default_initial`. A sync server
+    passes its `max_workers`, which caps the limit.
+    """
+    name = os.environ.get("CONCURRENCY_LIMITER", "")
+    if not name:
+        return None
+    try:
+        algorithm = ALGORITHMS[name]
+    except KeyError:
+        raise ValueError("unknown CONCURRENCY_LIMITER: " + name)
+    max_limit = int(os.environ.get("CONCURRENCY_LIMIT_MAX", "200"))
+    if max_workers is not None:
+        # a call admitted beyond the workers would queue for one anyway
+        max_limit = min(max_limit, max_workers)
+    initial = int(os.environ.get("CONCURRENCY_LIMIT_INITIAL", "0")) or default_initial
+    kwargs = {}
+    if name == "aimd":
+        kwargs["target"] = float(os.environ.get("CONCURRENCY_LATENCY_TARGET_SECONDS", "0.1"))
+    return ConcurrencyLimiter(algorithm(
+        initial=min(initial, max_limit),
+        min_limit=int(os.environ.get("CONCURRENCY_LIMIT_MIN", "1")),
+        max_limit=max_limit, **kwargs),
+        float(os.environ.get("CONCURRENCY_MAX_QUEUE_SECONDS", "10")))
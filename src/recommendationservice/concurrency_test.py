@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+
+import grpc
+import pytest
+
+import concurrency
+from concurrency import AIMDLimit, ConcurrencyLimiter, ConcurrencyLimitInterceptor
+
+
+class Context(object):
+    def __init__(self, remaining=None):
+        self.remaining = remaining
+
+    def time_remaining(self):
+        return self.remaining
+
+    def abort(self, code, details):
+        raise RuntimeError(code, details)
+
+
+CallDetails = collections.namedtuple("CallDetails", "method invocation_metadata")
+
+
+def limiter(initial=2, **kwargs):
+    return ConcurrencyLimiter(AIMDLimit(initial=initial, **kwargs))
+
+
+def test_limiter_admits_up_to_the_limit_and_releases():
+    limit = limiter(2, target=10)
+    first, second = limit.try_acquire(), limit.try_acquire()
+    assert first is not None and second is not None
+    assert limit.try_acquire() is None
+    with first.held(Context()):
+        pass
+    assert limit.inflight == 1
+    assert limit.try_acquire() is not None
+
+
+def test_release_is_idempotent():
+    limit = limiter(2)
+    permit = limit.try_acquire()
+    limit.release(permit)
+    limit.release(permit)
+    assert limit.inflight == 0
+
+
+def test_aimd_grows_when_fast_and_backs_off_on_deadline():
+    limit = limiter(2, target=10)
+    for _ in range(2):
+        permits = [limit.try_acquire(), limit.try_acquire()]
+        for permit in permits:
+            with permit.held(Context()):
+                pass
+    assert limit.limit > 2
+    grown = limit.limit
+    with limit.try_acquire().held(Context(remaining=0)):
+        pass
+    assert limit.limit < grown
+
+
+def test_unstarted_permits_are_reclaimed():
+    limit = ConcurrencyLimiter(AIMDLimit(initial=1), max_queue_time=0.01)
+    queued = limit.try_acquire()
+    assert limit.try_acquire() is None
+    time.sleep(0.02)
+    assert limit.try_acquire() is not None
+    # the reclaimed call running late does not free a second slot
+    with queued.held(Context()):
+        pass
+    assert limit.inflight == 1
+
+
+def test_interceptor_rejects_without_running_the_handler():
+    calls = []
+    handler = grpc.unary_unary_rpc_method_handler(lambda request, context: calls.append(request))
+    interceptor = ConcurrencyLimitInterceptor(limiter(1))
+    details = CallDetails("/hipstershop.RecommendationService/ListRecommendations", ())
+
+    admitted = interceptor.intercept_service(lambda d: handler, details)
+    rejected = interceptor.intercept_service(lambda d: handler, details)
+    with pytest.raises(RuntimeError) as raised:
+        rejected.unary_unary("request", Context())
+    assert raised.value.args[0] == grpc.StatusCode.RESOURCE_EXHAUSTED
+    admitted.unary_unary("request", Context())
+    assert calls == ["request"]
+
+    health = CallDetails("/grpc.health.v1.Health/Check", ())
+    assert interceptor.intercept_service(lambda d: handler, health) is handler
+
+
+def test_sync_limit_is_capped_at_the_worker_count(monkeypatch):
+    monkeypatch.setenv("CONCURRENCY_LIMITER", "aimd")
+    monkeypatch.setenv("CONCURRENCY_LIMIT_INITIAL", "50")
+    limit = concurrency.from_environment(10, 10)
+    assert limit.limit == 10
+    assert limit._algorithm._max == 10
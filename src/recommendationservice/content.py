@@ -0,0 +1,160 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-based recommendations from product text.
+
+Offline, every product's name, description and categories are turned into
+a hashed TF-IDF vector, L2-normalized and stored as one dense float32
+matrix. Online, the viewed products' vectors are summed into a query and
+the whole catalog is scored with a single matrix-vector product, so
+cosine similarity needs no external embedding service.
+
+Build a model from the product catalog:
+
+    python content.py --products ../productcatalogservice/products.json --output content.bin
+"""
+
+import argparse
+import collections
+import json
+import math
+import re
+import zlib
+
+import numpy as np
+
+import modelfile
+from strategies import ScoredStrategy
+
+KIND = "content"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it its of on or the this to with will "
+    "your you these those".split())
+# Categories are short and precise, so they count more than description words.
+_CATEGORY_WEIGHT = 3.0
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+def _product_terms(product):
+    terms = collections.Counter(tokenize(product.get("name", "")))
+    terms.update(tokenize(product.get("description", "")))
+    for category in product.get("categories", []):
+        terms["category:" + category.lower()] += _CATEGORY_WEIGHT
+    return terms
+
+
+def _bucket(term, dim):
+    h = zlib.crc32(term.encode("utf-8"))
+    # the sign bit halves the bias from colliding terms
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def build(products, dim=512):
+    """Returns (product ids, normalized float32 TF-IDF matrix) for product dicts."""
+    product_terms = [_product_terms(p) for p in products]
+    document_frequency = collections.Counter()
+    for terms in product_terms:
+        document_frequency.update(terms.keys())
+    n = len(products)
+
+    vectors = np.zeros((n, dim), dtype=np.float32)
+    for row, terms in enumerate(product_terms):
+        for term, tf in terms.items():
+            idf = math.log((1 + n) / (1 + document_frequency[term])) + 1
+            column, sign = _bucket(term, dim)
+            vectors[row, column] += sign * tf * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return [p["id"] for p in products], vectors
+
+
+class ContentModel(object):
+    def __init__(self, product_ids, vectors):
+        self.product_ids = product_ids
+        self.rows = {product_id: i for i, product_id in enumerate(product_ids)}
+        self.vectors = vectors
+
+    @classmethod
+    def load(cls, path):
+        meta, arrays = modelfile.read(path)
+        if meta.get("kind") != KIND:
+            raise ValueError("{} is not a content model".format(path))
+        vectors = arrays["vectors"]
+        if vectors.ndim != 2 or vectors.shape[0] != len(meta["product_ids"]):
+            raise ValueError("{}: vectors do not match product ids".format(path))
+        return cls(meta["product_ids"], vectors)
+
+    def save(self, path):
+        modelfile.write(
+            path,
+            {"kind": KIND, "product_ids": list(self.product_ids)},
+            {"vectors": self.vectors})
+
+    def query_vector(self, product_ids):
+        """Returns (normalized query vector, rows used) or (None, []) if unknown."""
+        rows = [self.rows[p] for p in product_ids if p in self.rows]
+        if not rows:
+            return None, rows
+        query = self.vectors[rows].sum(axis=0)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None, rows
+        return query / norm, rows
+
+    def top_k(self, product_ids, k):
+        """Returns up to k (product id, cosine similarity > 0) pairs, most similar first."""
+        query, rows = self.query_vector(product_ids)
+        if query is None or k <= 0:
+            return []
+        scores = self.vectors @ query
+        scores[rows] = -np.inf
+        k = min(k, len(scores) - len(set(rows)))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        # unrelated products are left for the caller's backfill
+        return [(self.product_ids[i], float(scores[i])) for i in best if scores[i] > 0]
+
+
+class ContentStrategy(ScoredStrategy):
+    name = "content"
+
+    def __init__(self, model):
+        self.model = model
+
+    def candidates(self, product_ids, n):
+        return self.model.top_k(product_ids, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build content vectors from products.json.")
+    parser.add_argument("--products", default="../productcatalogservice/products.json")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--dim", type=int, default=512, help="hashed feature dimensions")
+    args = parser.parse_args()
+
+    with open(args.products) as f:
+        products = json.load(f)["products"]
+    product_ids, vectors = build(products, args.dim)
+    ContentModel(product_ids, vectors).save(args.output)
+    print("wrote {} x {} vectors to {}".format(len(product_ids), args.dim, args.output))
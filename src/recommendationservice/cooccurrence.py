@@ -0,0 +1,175 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Item-to-item co-purchase recommendations.
+
+Offline, order events are folded into a sparse CSR matrix of co-occurrence
+weights and written with modelfile. Online, the rows for the requested
+products are summed and the best scoring columns picked with argpartition,
+so a request only touches the non-zeros of its own rows.
+
+Build a model from OrderResult messages exported as JSON lines:
+
+    python cooccurrence.py --orders orders.jsonl --output cooccurrence.bin
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import math
+
+import numpy as np
+
+import modelfile
+from strategies import ScoredStrategy
+
+KIND = "cooccurrence"
+
+
+class CooccurrenceModel(object):
+    def __init__(self, product_ids, indptr, indices, data):
+        self.product_ids = product_ids
+        self.rows = {product_id: i for i, product_id in enumerate(product_ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def load(cls, path):
+        meta, arrays = modelfile.read(path)
+        if meta.get("kind") != KIND:
+            raise ValueError("{} is not a co-occurrence model".format(path))
+        model = cls(meta["product_ids"], arrays["indptr"], arrays["indices"], arrays["data"])
+        if len(model.indptr) != len(model.product_ids) + 1 or \
+                len(model.indices) != len(model.data) or \
+                int(model.indptr[-1]) != len(model.indices):
+            raise ValueError("{}: inconsistent CSR arrays".format(path))
+        return model
+
+    def top_k(self, product_ids, k):
+        """Returns up to k (product id, score) pairs co-purchased with product_ids."""
+        rows = [self.rows[p] for p in product_ids if p in self.rows]
+        if not rows or k <= 0:
+            return []
+        indptr = self.indptr
+        if len(rows) == 1:
+            start, end = indptr[rows[0]], indptr[rows[0] + 1]
+            candidates = self.indices[start:end]
+            scores = np.asarray(self.data[start:end], dtype=np.float64)
+        else:
+            candidates = np.concatenate(
+                [self.indices[indptr[r]:indptr[r + 1]] for r in rows])
+            weights = np.concatenate(
+                [self.data[indptr[r]:indptr[r + 1]] for r in rows])
+            candidates, inverse = np.unique(candidates, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        keep = ~np.isin(candidates, rows)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return [(self.product_ids[candidates[i]], float(scores[i])) for i in order]
+
+
+class CooccurrenceStrategy(ScoredStrategy):
+    name = "cooccurrence"
+
+    def __init__(self, model):
+        self.model = model
+
+    def candidates(self, product_ids, n):
+        return self.model.top_k(product_ids, n)
+
+
+def _order_products(order):
+    products = set()
+    for item in order.get("items", []):
+        cart_item = item.get("item", {})
+        product_id = cart_item.get("productId") or cart_item.get("product_id")
+        if product_id:
+            products.add(product_id)
+    return products
+
+
+def build(orders, max_neighbors=100, normalize=True):
+    """Returns a CooccurrenceModel from an iterable of OrderResult dicts.
+
+    With `normalize`, weights are cosine-normalized by item frequency so that
+    best-sellers do not dominate every row.
+    """
+    pair_counts = collections.defaultdict(collections.Counter)
+    item_counts = collections.Counter()
+    for order in orders:
+        products = _order_products(order)
+        item_counts.update(products)
+        for a, b in itertools.permutations(products, 2):
+            pair_counts[a][b] += 1
+
+    product_ids = sorted(item_counts)
+    rows = {product_id: i for i, product_id in enumerate(product_ids)}
+    indptr = [0]
+    indices = []
+    data = []
+    for product_id in product_ids:
+        neighbors = []
+        for other, count in pair_counts[product_id].items():
+            weight = count
+            if normalize:
+                weight = count / math.sqrt(item_counts[product_id] * item_counts[other])
+            neighbors.append((weight, rows[other]))
+        neighbors.sort(reverse=True)
+        for weight, column in neighbors[:max_neighbors]:
+            indices.append(column)
+            data.append(weight)
+        indptr.append(len(indices))
+
+    return CooccurrenceModel(
+        product_ids,
+        np.asarray(indptr, dtype=np.int64),
+        np.asarray(indices, dtype=np.int32),
+        np.asarray(data, dtype=np.float32))
+
+
+def save(model, path):
+    modelfile.write(
+        path,
+        {"kind": KIND, "product_ids": list(model.product_ids)},
+        {"indptr": model.indptr, "indices": model.indices, "data": model.data})
+
+
+def _read_orders(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a co-occurrence model from orders.")
+    parser.add_argument("--orders", required=True, help="JSON lines of OrderResult messages")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--max-neighbors", type=int, default=100)
+    parser.add_argument("--raw-counts", action="store_true",
+                        help="store raw co-purchase counts instead of cosine weights")
+    args = parser.parse_args()
+
+    model = build(_read_orders(args.orders), args.max_neighbors, not args.raw_counts)
+    save(model, args.output)
+    print("wrote {} products, {} co-occurrences to {}".format(
+        len(model.product_ids), len(model.indices), args.output))
@@ -170,6 +170,11 @@ class RecommendationServiceStub(object):
                 request_serializer=demo__pb2.ListRecommendationsRequest.SerializeToString,
                 response_deserializer=demo__pb2.ListRecommendationsResponse.FromString,
                 )
+        self.ListRecommendationsBatch = channel.unary_unary(
+                '/hipstershop.RecommendationService/ListRecommendationsBatch',
+                request_serializer=demo__pb2.ListRecommendationsBatchRequest.SerializeToString,
+                response_deserializer=demo__pb2.ListRecommendationsBatchResponse.FromString,
+                )
 
 
 class RecommendationServiceServicer(object):
@@ -183,6 +188,12 @@ class RecommendationServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ListRecommendationsBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RecommendationServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -191,6 +202,11 @@ def add_RecommendationServiceServicer_to_server(servicer, server):
                     request_deserializer=demo__pb2.ListRecommendationsRequest.FromString,
                     response_serializer=demo__pb2.ListRecommendationsResponse.SerializeToString,
             ),
+            'ListRecommendationsBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListRecommendationsBatch,
+                    request_deserializer=demo__pb2.ListRecommendationsBatchRequest.FromString,
+                    response_serializer=demo__pb2.ListRecommendationsBatchResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'hipstershop.RecommendationService', rpc_method_handlers)
@@ -220,6 +236,23 @@ class RecommendationService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def ListRecommendationsBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/hipstershop.RecommendationService/ListRecommendationsBatch',
+            demo__pb2.ListRecommendationsBatchRequest.SerializeToString,
+            demo__pb2.ListRecommendationsBatchResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
 
 class ProductCatalogServiceStub(object):
     """---------------Product Catalog----------------
@@ -820,3 +853,133 @@ class AdService(object):
             demo__pb2.AdResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+
+class ImageGenerationServiceStub(object):
+    """------------Image Generation service------------------
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.GenerateCartImage = channel.unary_unary(
+                '/hipstershop.ImageGenerationService/GenerateCartImage',
+                request_serializer=demo__pb2.GenerateCartImageRequest.SerializeToString,
+                response_deserializer=demo__pb2.GenerateCartImageResponse.FromString,
+                )
+        self.UploadBackground = channel.unary_unary(
+                '/hipstershop.ImageGenerationService/UploadBackground',
+                request_serializer=demo__pb2.UploadBackgroundRequest.SerializeToString,
+                response_deserializer=demo__pb2.UploadBackgroundResponse.FromString,
+                )
+        self.GetImageGenerationStatus = channel.unary_unary(
+                '/hipstershop.ImageGenerationService/GetImageGenerationStatus',
+                request_serializer=demo__pb2.GetStatusRequest.SerializeToString,
+                response_deserializer=demo__pb2.GetStatusResponse.FromString,
+                )
+
+
+class ImageGenerationServiceServicer(object):
+    """------------Image Generation service------------------
+    """
+
+    def GenerateCartImage(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def UploadBackground(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetImageGenerationStatus(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_ImageGenerationServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'GenerateCartImage': grpc.unary_unary_rpc_method_handler(
+                    servicer.GenerateCartImage,
+                    request_deserializer=demo__pb2.GenerateCartImageRequest.FromString,
+                    response_serializer=demo__pb2.GenerateCartImageResponse.SerializeToString,
+            ),
+            'UploadBackground': grpc.unary_unary_rpc_method_handler(
+                    servicer.UploadBackground,
+                    request_deserializer=demo__pb2.UploadBackgroundRequest.FromString,
+                    response_serializer=demo__pb2.UploadBackgroundResponse.SerializeToString,
+            ),
+            'GetImageGenerationStatus': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetImageGenerationStatus,
+                    request_deserializer=demo__pb2.GetStatusRequest.FromString,
+                    response_serializer=demo__pb2.GetStatusResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'hipstershop.ImageGenerationService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class ImageGenerationService(object):
+    """------------Image Generation service------------------
+    """
+
+    @staticmethod
+    def GenerateCartImage(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/hipstershop.ImageGenerationService/GenerateCartImage',
+            demo__pb2.GenerateCartImageRequest.SerializeToString,
+            demo__pb2.GenerateCartImageResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def UploadBackground(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/hipstershop.ImageGenerationService/UploadBackground',
+            demo__pb2.UploadBackgroundRequest.SerializeToString,
+            demo__pb2.UploadBackgroundResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetImageGenerationStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/hipstershop.ImageGenerationService/GetImageGenerationStatus',
+            demo__pb2.GetStatusRequest.SerializeToString,
+            demo__pb2.GetStatusResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deterministic, cacheable recommendations.
+
+The random generator for a request is seeded from the user id, the set of
+requested products, the catalog and model versions, the version of any
+state the strategy reloads (the catalog and weights a popularity table was
+built from) and the current time bucket. Identical requests in the same window get identical answers on any
+replica, and the seed's digest doubles as a strong ETag. Strategies driven
+by live counters (trending) cannot give such answers and are refused.
+"""
+
+import hashlib
+import os
+import time
+
+
+class Seeder(object):
+    def __init__(self, window, clock=time.time):
+        self._window = window
+        self._clock = clock
+
+    def seed(self, request, catalog_version, model_version):
+        """Returns (integer seed, quoted ETag) for a ListRecommendationsRequest."""
+        bucket = int(self._clock() // self._window)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(request.user_id.encode("utf-8"))
+        for product_id in sorted(set(request.product_ids)):
+            digest.update(b"\0")
+            digest.update(product_id.encode("utf-8"))
+        digest.update("\0{}\0{}\0{}".format(catalog_version, model_version, bucket).encode("utf-8"))
+        return int.from_bytes(digest.digest()[:8], "little"), '"{}"'.format(digest.hexdigest())
+
+
+def check(split):
+    """Raises ValueError if an arm of the TrafficSplit is not deterministic."""
+    for arm in split.arms:
+        if not arm.deterministic:
+            raise ValueError(
+                "strategy {} depends on live counters and cannot be used with "
+                "DETERMINISTIC_RECOMMENDATIONS=1".format(arm.name))
+
+
+def combine_etags(etags):
+    """Returns one ETag covering several responses, in order."""
+    digest = hashlib.blake2b(digest_size=16)
+    for etag in etags:
+        digest.update(etag.encode("utf-8"))
+        digest.update(b"\0")
+    return '"{}"'.format(digest.hexdigest())
+
+
+def from_environment():
+    """Returns a Seeder when DETERMINISTIC_RECOMMENDATIONS=1, else None."""
+    if os.environ.get("DETERMINISTIC_RECOMMENDATIONS", "0") != "1":
+        return None
+    return Seeder(float(os.environ.get("DETERMINISTIC_WINDOW_SECONDS", "300")))
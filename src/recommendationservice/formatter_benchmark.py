@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares JSON log formatter throughput in records per second.
+
+Formats the ListRecommendations request record and a metrics record (with
+an extra= field) with FastJsonFormatter and, when python-json-logger is
+installed, with the python-json-logger formatter the services used before
+it. Then shows what a disabled DEBUG call costs with eager str.format and
+with %-style arguments. Usage: python formatter_benchmark.py [iterations]
+"""
+
+import logging
+import sys
+import timeit
+
+import logger as jsonlog
+
+IDS = ["OLJCESPC7Z", "66VCHSJNUP", "1YMWWN1N4O", "L9ECAV7KIM", "2ZYFJ3GM2N"]
+
+
+def baseline_formatter():
+    """Returns the former python-json-logger formatter, or None if it is not installed."""
+    try:
+        from pythonjsonlogger import jsonlogger
+    except ImportError:
+        return None
+
+    class CustomJsonFormatter(jsonlogger.JsonFormatter):
+        def add_fields(self, log_record, record, message_dict):
+            super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
+            if not log_record.get('timestamp'):
+                log_record['timestamp'] = record.created
+            if log_record.get('severity'):
+                log_record['severity'] = log_record['severity'].upper()
+            else:
+                log_record['severity'] = record.levelname
+
+    return CustomJsonFormatter('%(timestamp)s %(severity)s %(name)s %(message)s')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    log = logging.getLogger("recommendationservice-server")
+    records = {
+        "request": log.makeRecord(
+            log.name, logging.INFO, __file__, 0,
+            "[Recv ListRecommendations] product_ids=%s", (IDS,), None),
+        "metrics": log.makeRecord(
+            log.name, logging.INFO, __file__, 0, "metrics", (), None,
+            extra={"metrics": {"result_cache_hits_total": 1234, "catalog_snapshot_age_seconds": 12.5}}),
+    }
+    formatters = [("FastJsonFormatter", jsonlog.FastJsonFormatter())]
+    baseline = baseline_formatter()
+    if baseline is not None:
+        formatters.insert(0, ("CustomJsonFormatter", baseline))
+    else:
+        print("python-json-logger is not installed; skipping CustomJsonFormatter")
+    print("JSON encoder: {}".format("orjson" if jsonlog.orjson is not None else "json"))
+    print("{:>10} {:>22} {:>14}".format("record", "formatter", "records/s"))
+    for record_name, record in records.items():
+        for formatter_name, formatter in formatters:
+            elapsed = timeit.timeit(lambda: formatter.format(record), number=iterations)
+            print("{:>10} {:>22} {:>14,.0f}".format(
+                record_name, formatter_name, iterations / elapsed))
+
+    log.setLevel(logging.INFO)
+    eager = timeit.timeit(
+        lambda: log.debug("[Recv ListRecommendations] product_ids={}".format(IDS)),
+        number=iterations)
+    lazy = timeit.timeit(
+        lambda: log.debug("[Recv ListRecommendations] product_ids=%s", IDS),
+        number=iterations)
+    print("disabled DEBUG call: str.format {:.3f} us, %-args {:.3f} us".format(
+        eager / iterations * 1e6, lazy / iterations * 1e6))
+
+
+if __name__ == "__main__":
+    main()
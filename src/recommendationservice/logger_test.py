@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import logging
+import threading
+
+from logger import AsyncStreamHandler, FastJsonFormatter, SamplingFilter
+
+
+class BlockingStream(io.StringIO):
+    """A stream whose writes wait until `release` is set."""
+
+    def __init__(self):
+        super(BlockingStream, self).__init__()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait()
+        return super(BlockingStream, self).write(data)
+
+
+def record(message, level=logging.INFO):
+    return logging.makeLogRecord({
+        'name': 'test', 'levelno': level, 'levelname': logging.getLevelName(level),
+        'msg': message})
+
+
+def test_async_stream_handler_counts_and_reports_every_drop():
+    stream = BlockingStream()
+    handler = AsyncStreamHandler(stream, capacity=10, batch_size=1)
+    handler.setFormatter(FastJsonFormatter())
+    threads = [threading.Thread(target=lambda: [handler.emit(record('m')) for _ in range(100)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stream.release.set()
+    handler.close()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    written = sum(1 for line in lines if line['message'] == 'm')
+    reported = sum(int(line['message'].split()[1]) for line in lines
+                   if line['message'].startswith('dropped'))
+    assert written + handler.dropped == 400
+    assert reported == handler.dropped > 0
+
+
+def test_async_stream_handler_writes_queued_records_in_order_on_close():
+    stream = io.StringIO()
+    handler = AsyncStreamHandler(stream, batch_size=7)
+    handler.setFormatter(FastJsonFormatter())
+    for i in range(50):
+        handler.emit(record('m%d' % i))
+    handler.close()
+    messages = [json.loads(line)['message'] for line in stream.getvalue().splitlines()]
+    assert messages == ['m%d' % i for i in range(50)]
+
+
+def sampling_filter(tmp_path, rules):
+    path = tmp_path / 'sampling.json'
+    path.write_text(json.dumps(rules))
+    return SamplingFilter(str(path), reload_interval=3600), path
+
+
+def test_sampling_filter_samples_matching_templates(tmp_path):
+    sampler, _ = sampling_filter(tmp_path, [{'match': '[Recv', 'sample': 3}])
+    allowed = [sampler.filter(record('[Recv ListRecommendations] %s')) for _ in range(9)]
+    assert allowed == [True, False, False] * 3
+    assert all(sampler.filter(record('other %s')) for _ in range(5))
+    assert sampler.filter(record('[Recv %s', logging.WARNING))
+
+
+def test_sampling_filter_rate_limits_per_second(tmp_path):
+    sampler, _ = sampling_filter(tmp_path, [{'match': 'hot', 'per_second': 2}])
+    allowed = [sampler.filter(record('hot %s')) for _ in range(10)]
+    assert allowed.count(True) == 2
+    seen, suppressed = sampler._rules[0].drain()
+    assert (seen, suppressed) == (10, 8)
+
+
+def test_sampling_filter_keeps_rules_when_reload_is_malformed(tmp_path):
+    sampler, path = sampling_filter(tmp_path, [{'match': 'hot', 'sample': 2}])
+    path.write_text(json.dumps([{'match': 5}]))
+    sampler._mtime = None
+    sampler.reload()
+    assert [sampler.filter(record('hot %s')) for _ in range(4)] == [True, False] * 2
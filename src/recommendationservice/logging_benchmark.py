@@ -0,0 +1,80 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures what a logger.info call costs the calling thread.
+
+Compares the synchronous StreamHandler with AsyncStreamHandler for the
+request log line of ListRecommendations, writing JSON to /dev/null and to
+a slow stream standing in for a stdout pipe whose reader is falling behind.
+With a fast stream both are CPU bound and the writer thread competes for
+the GIL; the difference shows once writes block.
+Usage: python logging_benchmark.py [iterations]
+"""
+
+import logging
+import os
+import sys
+import time
+
+import logger as jsonlog
+
+IDS = ["OLJCESPC7Z", "66VCHSJNUP", "1YMWWN1N4O", "L9ECAV7KIM", "2ZYFJ3GM2N"]
+
+
+class SlowStream(object):
+    def __init__(self, stream, delay):
+        self._stream = stream
+        self._delay = delay
+
+    def write(self, data):
+        time.sleep(self._delay)
+        return self._stream.write(data)
+
+    def flush(self):
+        self._stream.flush()
+
+
+def measure(handler, iterations):
+    log = logging.getLogger("benchmark-{}".format(id(handler)))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    handler.setFormatter(jsonlog.FastJsonFormatter())
+    started = time.perf_counter()
+    for _ in range(iterations):
+        log.info("[Recv ListRecommendations] product_ids={}".format(IDS))
+    elapsed = time.perf_counter() - started
+    handler.close()
+    return elapsed / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("{:>20} {:>20} {:>12} {:>10}".format("stream", "handler", "us/call", "dropped"))
+    with open(os.devnull, "w") as devnull:
+        for name, stream, count in (
+                ("/dev/null", devnull, iterations),
+                ("0.1ms per write", SlowStream(devnull, 0.0001), iterations // 10)):
+            sync = measure(logging.StreamHandler(stream), count)
+            handler = jsonlog.AsyncStreamHandler(stream, capacity=count)
+            queued = measure(handler, count)
+            print("{:>20} {:>20} {:>12.2f} {:>10}".format(name, "StreamHandler", sync, 0))
+            print("{:>20} {:>20} {:>12.2f} {:>10}".format(
+                name, "AsyncStreamHandler", queued, handler.dropped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Minimal in-process metrics for the recommendation service.
+
+Metrics are kept in a process-wide registry and periodically emitted as a
+single structured log line, so they can be turned into log-based metrics
+without adding a metrics backend dependency to the service.
+"""
+
+import bisect
+import threading
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    rendered = ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items()))
+    return "{}{{{}}}".format(name, rendered)
+
+
+class Counter(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def collect(self):
+        return self._value
+
+
+class Gauge(object):
+    """A gauge that is either set explicitly or read from a callback."""
+
+    def __init__(self, fn=None):
+        self._fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        if self._fn is not None:
+            return self._fn()
+        return self._value
+
+    def collect(self):
+        return self.value
+
+
+class Histogram(object):
+    """Cumulative-bucket histogram, e.g. for latencies in seconds."""
+
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def collect(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self._bounds + ("+Inf",), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "sum": total, "count": cumulative}
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, name, labels, factory):
+        key = _key(name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = factory()
+                self._metrics[key] = metric
+            return metric
+
+    def counter(self, name, labels=None):
+        return self._get_or_create(name, labels, Counter)
+
+    def gauge(self, name, fn=None, labels=None):
+        return self._get_or_create(name, labels, lambda: Gauge(fn))
+
+    def histogram(self, name, labels=None, buckets=Histogram.DEFAULT_BUCKETS):
+        return self._get_or_create(name, labels, lambda: Histogram(buckets))
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._metrics.items())
+        return {key: metric.collect() for key, metric in items}
+
+
+REGISTRY = Registry()
+
+
+def start_reporter(logger, interval, registry=REGISTRY):
+    """Logs a snapshot of every metric each `interval` seconds."""
+    def report():
+        while not stopped.wait(interval):
+            try:
+                logger.info("metrics", extra={"metrics": registry.snapshot()})
+            except Exception as exc:
+                logger.warning("Unable to report metrics: " + str(exc))
+
+    stopped = threading.Event()
+    thread = threading.Thread(target=report, name="metrics-reporter", daemon=True)
+    thread.start()
+    return stopped
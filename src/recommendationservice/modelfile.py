@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Single-file container for memory-mapped model arrays.
+
+Layout: an 8 byte magic, the header length as a little-endian uint32, a
+JSON header describing metadata and arrays, then every array's raw bytes
+at 64 byte aligned offsets. Readers map the file read-only, so all worker
+processes on a node share one copy of the model in the page cache.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"RECMODEL"
+_ALIGN = 64
+
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write(path, meta, arrays):
+    """Writes `arrays` (a name -> ndarray dict) and JSON-able `meta` to path."""
+    specs = []
+    offset = 0
+    contiguous = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        contiguous[name] = array
+        specs.append({
+            "name": name,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        })
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({"meta": meta, "arrays": specs}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for spec in specs:
+            f.seek(data_start + spec["offset"])
+            f.write(contiguous[spec["name"]].tobytes())
+        f.truncate(data_start + offset)
+
+
+def read(path):
+    """Maps the file at path; returns (meta, name -> read-only ndarray)."""
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(mapped[:len(MAGIC)]) != MAGIC:
+        raise ValueError("{} is not a model file".format(path))
+    header_len, = struct.unpack("<I", bytes(mapped[len(MAGIC):len(MAGIC) + 4]))
+    header_start = len(MAGIC) + 4
+    header = json.loads(bytes(mapped[header_start:header_start + header_len]))
+    data_start = _align(header_start + header_len)
+
+    arrays = {}
+    for spec in header["arrays"]:
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = data_start + spec["offset"]
+        if start + count * dtype.itemsize > len(mapped):
+            raise ValueError("{}: array {} is truncated".format(path, spec["name"]))
+        arrays[spec["name"]] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=start).reshape(spec["shape"])
+    return header["meta"], arrays
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Popularity-weighted sampling with Vose alias tables.
+
+An alias table turns any discrete distribution into two arrays so that each
+draw costs one uniform index and one coin flip, whatever the catalog size.
+Tables are rebuilt in the background whenever the catalog snapshot or the
+weights change; requests keep drawing from the previous table meanwhile.
+Only the first table is built on a request thread, once, under a lock.
+
+Weights come from a source exposing a cheap current() -> (version,
+{id: weight}): a JSON file (FileWeights), versioned by a hash of its
+content so every replica agrees, or live counters. A source that
+has to reload, like FileWeights, also exposes refresh(), which the
+background builder calls at most every refresh interval.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from array import array
+
+from metrics import REGISTRY
+
+
+class AliasTable(object):
+    __slots__ = ("ids", "prob", "alias")
+
+    def __init__(self, ids, weights):
+        n = len(ids)
+        weights = [float(w) for w in weights]
+        if not all(0.0 <= w < math.inf for w in weights):
+            # a NaN fails both comparisons
+            raise ValueError("alias table weights must be finite and non-negative")
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("alias table needs at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        prob = array("d", bytes(8 * n))
+        alias = array("i", bytes(4 * n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # leftovers are 1.0 up to rounding error
+        for i in large + small:
+            prob[i] = 1.0
+            alias[i] = i
+        self.ids = tuple(ids)
+        self.prob = prob
+        self.alias = alias
+
+    def draw(self, rng=random):
+        i = int(rng.random() * len(self.prob))
+        if rng.random() < self.prob[i]:
+            return self.ids[i]
+        return self.ids[self.alias[i]]
+
+    def sample(self, k, excluded=(), rng=random, max_attempts=None):
+        """Draws up to k distinct ids not in `excluded`, rejecting repeats.
+
+        Attempts are bounded, so very skewed weights may return fewer than k.
+        """
+        seen = set(excluded)
+        picked = []
+        attempts = max_attempts or 8 * k + len(seen)
+        for _ in range(attempts):
+            product_id = self.draw(rng)
+            if product_id not in seen:
+                seen.add(product_id)
+                picked.append(product_id)
+                if len(picked) == k:
+                    break
+        return picked
+
+
+def parse_weights(document):
+    """Returns {id: weight} from a decoded JSON object, else raises ValueError.
+
+    Every weight must be a finite, non-negative number.
+    """
+    if not isinstance(document, dict):
+        raise ValueError("popularity weights must be a JSON object")
+    weights = {}
+    for product_id, weight in document.items():
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or \
+                not 0 <= weight < math.inf:
+            raise ValueError("bad popularity weight for {}: {!r}".format(product_id, weight))
+        weights[product_id] = float(weight)
+    return weights
+
+
+class FileWeights(object):
+    """Weights from a JSON object mapping product id to weight.
+
+    The file is loaded when constructed; refresh() reloads it if its mtime
+    or size changed. The version is a hash of the file's content, not its
+    mtime, so replicas given the same weights report the same version.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._stat = None
+        self._current = (None, {})
+        self._reload()
+
+    def _reload(self):
+        stat = os.stat(self._path)
+        if (stat.st_mtime, stat.st_size) == self._stat:
+            return
+        with open(self._path, "rb") as f:
+            data = f.read()
+        version = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if version != self._current[0]:
+            self._current = (version, parse_weights(json.loads(data)))
+        self._stat = (stat.st_mtime, stat.st_size)
+
+    def refresh(self):
+        try:
+            self._reload()
+        except (OSError, ValueError, OverflowError):
+            # unreadable or malformed: keep serving the weights we have
+            pass
+
+    def current(self):
+        return self._current
+
+
+class PopularityStrategy(object):
+    name = "popularity"
+
+    def __init__(self, source, default_weight=1.0, refresh_interval=10, clock=time.monotonic):
+        self._source = source
+        self._default_weight = default_weight
+        self.deterministic = getattr(source, "deterministic", True)
+        self._refresh = getattr(source, "refresh", None)
+        self._refresh_interval = refresh_interval
+        self._clock = clock
+        self._refreshed_at = clock()
+        self._build_failures = REGISTRY.counter("popularity_table_build_failures_total")
+        # (table, key), published as one reference so a request never
+        # pairs one weights version with another version's table
+        self._built = None
+        self._building = False
+        self._lock = threading.Lock()
+        self._first_build_lock = threading.Lock()
+
+    def built_for(self, snapshot):
+        """Returns the (table, (catalog version, weights version)) to sample with."""
+        built = self._built
+        if built is None:
+            # first request: nothing to serve from yet; build it just once
+            with self._first_build_lock:
+                if self._built is None:
+                    version, weights = self._source.current()
+                    self._build(snapshot, (snapshot.version, version), weights)
+            return self._built
+        refresh_due = self._refresh is not None and \
+            self._clock() - self._refreshed_at > self._refresh_interval
+        if refresh_due or built[1] != (snapshot.version, self._source.current()[0]):
+            self._rebuild_in_background(snapshot, refresh_due)
+        return built
+
+    def pin(self, snapshot):
+        """Returns (version, state) for recommend() to sample with.
+
+        The version is the table's full key: while a rebuild for a new
+        catalog runs, requests keep drawing from the old table, and its
+        catalog version must show in seeds, ETags and cache keys.
+        """
+        built = self.built_for(snapshot)
+        return built[1], built
+
+    def recommend(self, snapshot, product_ids, k, rng=random, state=None):
+        table, _ = state if state is not None else self.built_for(snapshot)
+        if table is None:
+            return []
+        positions = snapshot.index.positions
+        picked = table.sample(k, product_ids, rng)
+        # a table built for an older snapshot may name removed products
+        return [p for p in picked if p in positions]
+
+    def _build(self, snapshot, key, weights):
+        default = self._default_weight
+        ids = snapshot.index.ids
+        try:
+            table = AliasTable(ids, [weights.get(p, default) for p in ids])
+        except ValueError:
+            # every weight is zero: leave all slots to the uniform backfill
+            table = None
+            self._build_failures.inc()
+        self._built = (table, key)
+
+    def _rebuild_in_background(self, snapshot, refresh):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            if refresh:
+                self._refreshed_at = self._clock()
+
+        def rebuild():
+            try:
+                if refresh:
+                    # stat and parse the weights file off the request path
+                    self._refresh()
+                version, weights = self._source.current()
+                key = (snapshot.version, version)
+                built = self._built
+                if built is None or key != built[1]:
+                    self._build(snapshot, key, weights)
+            finally:
+                self._building = False
+
+        threading.Thread(target=rebuild, name="alias-table-builder", daemon=True).start()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import time
+
+import pytest
+
+import demo_pb2
+from catalog import CatalogSnapshot
+from popularity import AliasTable, FileWeights, PopularityStrategy
+
+
+class StaticWeights(object):
+    def current(self):
+        return "w1", {}
+
+
+def snapshot_of(n):
+    return CatalogSnapshot([demo_pb2.Product(id="p{}".format(i)) for i in range(n)])
+
+
+@pytest.mark.parametrize("weights", [[1, -1], [1, math.nan], [1, math.inf]])
+def test_alias_table_rejects_bad_weights(weights):
+    with pytest.raises(ValueError):
+        AliasTable(["a", "b"], weights)
+
+
+@pytest.mark.parametrize("document", [
+    '["a", "b"]',
+    '"a"',
+    '{"a": "heavy"}',
+    '{"a": [1]}',
+    '{"a": -1}',
+    '{"a": NaN}',
+    '{"a": 1e400}',
+    '{"a": 1',
+])
+def test_file_weights_keep_last_good_weights(tmp_path, document):
+    path = tmp_path / "popularity.json"
+    path.write_text('{"a": 2, "b": 1}')
+    weights = FileWeights(str(path))
+    good = weights.current()
+
+    path.write_text(document)
+    weights.refresh()
+    assert weights.current() == good
+
+    path.write_text('{"a": 3}')
+    weights.refresh()
+    assert weights.current()[1] == {"a": 3.0}
+
+
+def test_pin_reports_the_catalog_the_table_was_built_for():
+    strategy = PopularityStrategy(StaticWeights())
+    old, new = snapshot_of(5), snapshot_of(50)
+    assert strategy.pin(old)[0] == (old.version, "w1")
+
+    # the old table is served while the new one is built in the background
+    version, (table, _) = strategy.pin(new)
+    assert version == (old.version, "w1")
+    assert len(table.ids) == 5
+
+    deadline = time.monotonic() + 5
+    while strategy.pin(new)[0] != (new.version, "w1"):
+        assert time.monotonic() < deadline, "table was not rebuilt"
+        time.sleep(0.01)
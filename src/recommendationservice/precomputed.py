@@ -0,0 +1,156 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Recommendations precomputed offline for every product.
+
+A batch job asks a model (co-occurrence, content or ANN) once for the top-N
+recommendations of each product and writes them with modelfile as a table
+sorted by product id:
+
+    keys    S<width>[n]     product ids, sorted
+    recs    int32[n, N]     rows of keys, best first, padded with -1
+    scores  float32[n, N]
+
+Online, the table is memory-mapped and a product's row is found by binary
+search over keys. The rows of the requested products are merged by summed
+score; products without a row are left to the uniform backfill.
+
+    python precomputed.py --source cooccurrence --model cooccurrence.bin \\
+        --output precomputed.bin --top-n 20
+"""
+
+import argparse
+import collections
+import heapq
+import operator
+
+import numpy as np
+
+import modelfile
+from strategies import ScoredStrategy
+
+KIND = "precomputed"
+
+
+class PrecomputedTable(object):
+    def __init__(self, keys, recs, scores):
+        self.keys = keys
+        self.recs = recs
+        self.scores = scores
+
+    @classmethod
+    def load(cls, path):
+        meta, arrays = modelfile.read(path)
+        if meta.get("kind") != KIND:
+            raise ValueError("{} is not a precomputed table".format(path))
+        table = cls(arrays["keys"], arrays["recs"], arrays["scores"])
+        n = len(table.keys)
+        if table.recs.ndim != 2 or table.recs.shape[0] != n or \
+                table.scores.shape != table.recs.shape:
+            raise ValueError("{}: inconsistent table arrays".format(path))
+        if n > 1 and not bool(np.all(table.keys[:-1] < table.keys[1:])):
+            raise ValueError("{}: keys are not sorted".format(path))
+        if table.recs.size and (int(table.recs.max()) >= n or int(table.recs.min()) < -1):
+            raise ValueError("{}: recommendation out of range".format(path))
+        return table
+
+    def row(self, product_id):
+        """Returns the row of product_id, or -1 if it has none."""
+        key = product_id.encode("utf-8")
+        keys = self.keys
+        if len(key) > keys.dtype.itemsize:
+            return -1
+        i = int(np.searchsorted(keys, key))
+        if i < len(keys) and keys[i] == key:
+            return i
+        return -1
+
+    def top_k(self, product_ids, k):
+        """Returns up to k (product id, score) pairs for product_ids, merged."""
+        rows = set(self.row(p) for p in product_ids)
+        rows.discard(-1)
+        if not rows or k <= 0:
+            return []
+        merged = collections.defaultdict(float)
+        for r in rows:
+            for rec, score in zip(self.recs[r].tolist(), self.scores[r].tolist()):
+                if rec < 0:
+                    break
+                merged[rec] += score
+        for r in rows:
+            merged.pop(r, None)
+        best = heapq.nlargest(k, merged.items(), key=operator.itemgetter(1))
+        return [(self.keys[r].decode("utf-8"), score) for r, score in best]
+
+
+class PrecomputedStrategy(ScoredStrategy):
+    name = "precomputed"
+
+    def __init__(self, table):
+        self.table = table
+
+    def candidates(self, product_ids, n):
+        return self.table.top_k(product_ids, n)
+
+
+def build(model, top_n=20):
+    """Returns a PrecomputedTable of model.top_k([p], top_n) for each product."""
+    product_ids = sorted(model.product_ids, key=lambda p: p.encode("utf-8"))
+    encoded = [p.encode("utf-8") for p in product_ids]
+    rows = {p: i for i, p in enumerate(product_ids)}
+    width = max([len(key) for key in encoded] + [1])
+    keys = np.array(encoded, dtype="S{}".format(width))
+    recs = np.full((len(product_ids), top_n), -1, dtype=np.int32)
+    scores = np.zeros((len(product_ids), top_n), dtype=np.float32)
+    for i, product_id in enumerate(product_ids):
+        for j, (rec, score) in enumerate(model.top_k([product_id], top_n)):
+            recs[i, j] = rows[rec]
+            scores[i, j] = score
+    return PrecomputedTable(keys, recs, scores)
+
+
+def save(table, path):
+    modelfile.write(
+        path, {"kind": KIND},
+        {"keys": table.keys, "recs": table.recs, "scores": table.scores})
+
+
+def _load_source(source, path):
+    if source == "cooccurrence":
+        from cooccurrence import CooccurrenceModel
+        return CooccurrenceModel.load(path)
+    if source == "content":
+        from content import ContentModel
+        return ContentModel.load(path)
+    if source == "ann":
+        from ann import IVFIndex
+        return IVFIndex.load(path)
+    raise ValueError("unknown source: " + source)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute recommendations for every product of a model.")
+    parser.add_argument("--source", required=True, choices=["cooccurrence", "content", "ann"])
+    parser.add_argument("--model", required=True, help="model file of the given source")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--top-n", type=int, default=20)
+    args = parser.parse_args()
+
+    table = build(_load_source(args.source, args.model), args.top_n)
+    save(table, args.output)
+    print("wrote {} products x {} recommendations to {}".format(
+        len(table.keys), args.top_n, args.output))
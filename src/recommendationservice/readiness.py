@@ -0,0 +1,118 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Readiness published through the standard gRPC health service.
+
+The server registers grpc_health's HealthServicer (or its asyncio variant),
+which implements Check and a streaming Watch. Readiness keeps the overall
+status and each named service NOT_SERVING until every warmup check passes,
+and afterwards while the prefork cluster is not serving, and pushes each
+change to the servicer so watchers are notified. Once stopped, every status
+is NOT_SERVING for good, so load balancers stop sending calls to a server
+that is draining.
+"""
+
+import asyncio
+import threading
+
+from grpc_health.v1 import health
+from grpc_health.v1 import health_pb2
+
+import prefork
+
+SERVING = health_pb2.HealthCheckResponse.SERVING
+NOT_SERVING = health_pb2.HealthCheckResponse.NOT_SERVING
+
+
+class Readiness(object):
+    def __init__(self, services, checks=(), poll_interval=1.0):
+        """`checks` are callables returning True once their part is warm."""
+        self._services = (health.OVERALL_HEALTH,) + tuple(services)
+        self._checks = list(checks)
+        self._poll_interval = poll_interval
+        self._warm = False
+        self._changed = threading.Event()
+        self._poked = None
+        self._stopped = False
+        self._servicer = None
+
+    def status(self):
+        if not self._warm:
+            # once warm, a check going false again does not make us unready
+            self._warm = all(check() for check in self._checks)
+            if not self._warm:
+                return NOT_SERVING
+        if not prefork.cluster_serving():
+            return NOT_SERVING
+        return SERVING
+
+    def poke(self):
+        """Re-evaluates the checks now rather than at the next poll."""
+        self._changed.set()
+        if self._poked is not None:
+            self._poked.set()
+
+    def stop(self):
+        """Reports NOT_SERVING from now on; call before draining the server.
+
+        With serve_async, the statuses change once its task has finished.
+        """
+        self._stopped = True
+        if self._servicer is not None:
+            # later set() calls are ignored, so the publish loop cannot undo it
+            self._servicer.enter_graceful_shutdown()
+        self.poke()
+
+    def serve(self, servicer):
+        """Starts a thread keeping a HealthServicer's statuses up to date."""
+        for service in self._services:
+            servicer.set(service, NOT_SERVING)
+        self._servicer = servicer
+
+        def run():
+            published = NOT_SERVING
+            while not self._stopped:
+                status = self.status()
+                if status != published:
+                    for service in self._services:
+                        servicer.set(service, status)
+                    published = status
+                self._changed.wait(self._poll_interval)
+                self._changed.clear()
+
+        threading.Thread(target=run, name="readiness", daemon=True).start()
+
+    async def serve_async(self, servicer):
+        """Keeps a health.aio.HealthServicer's statuses up to date; run as a task.
+
+        After stop(), the task reports NOT_SERVING and finishes; await it.
+        """
+        self._poked = asyncio.Event()
+        for service in self._services:
+            await servicer.set(service, NOT_SERVING)
+        published = NOT_SERVING
+        while not self._stopped:
+            status = self.status()
+            if status != published:
+                for service in self._services:
+                    await servicer.set(service, status)
+                published = status
+            try:
+                await asyncio.wait_for(self._poked.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._poked.clear()
+        await servicer.enter_graceful_shutdown()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+
+from grpc_health.v1 import health
+from grpc_health.v1 import health_pb2
+
+from readiness import NOT_SERVING, SERVING, Readiness
+
+SERVICE = "hipstershop.RecommendationService"
+
+
+def check(servicer, service=SERVICE):
+    return servicer.Check(health_pb2.HealthCheckRequest(service=service), None).status
+
+
+def wait_for(servicer, status):
+    deadline = time.monotonic() + 5
+    while check(servicer) != status:
+        assert time.monotonic() < deadline, "health status never became {}".format(status)
+        time.sleep(0.01)
+
+
+def test_check_reports_not_serving_after_stop():
+    servicer = health.HealthServicer()
+    ready = Readiness([SERVICE], [lambda: True], poll_interval=0.01)
+    ready.serve(servicer)
+    wait_for(servicer, SERVING)
+
+    ready.stop()
+    assert check(servicer) == NOT_SERVING
+    assert check(servicer, "") == NOT_SERVING
+    # the publish loop must not flip it back
+    time.sleep(0.05)
+    assert check(servicer) == NOT_SERVING
+
+
+def test_async_check_reports_not_serving_after_stop():
+    async def run():
+        servicer = health.aio.HealthServicer()
+        ready = Readiness([SERVICE], [lambda: True], poll_interval=0.01)
+        task = asyncio.create_task(ready.serve_async(servicer))
+        request = health_pb2.HealthCheckRequest(service=SERVICE)
+        # let the task register the services
+        await asyncio.sleep(0)
+        while (await servicer.Check(request, None)).status != SERVING:
+            await asyncio.sleep(0.01)
+
+        ready.stop()
+        await task
+        return (await servicer.Check(request, None)).status
+
+    assert asyncio.run(asyncio.wait_for(run(), 5)) == NOT_SERVING
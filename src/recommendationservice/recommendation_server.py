@@ -14,31 +14,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import os
 import random
+import signal
+import threading
 import time
 import traceback
 from concurrent import futures
 
-import googlecloudprofiler
-from google.auth.exceptions import DefaultCredentialsError
 import grpc
 
 import demo_pb2
 import demo_pb2_grpc
-from grpc_health.v1 import health_pb2
+from grpc_health.v1 import health
 from grpc_health.v1 import health_pb2_grpc
 
-from opentelemetry import trace
-from opentelemetry.instrumentation.grpc import GrpcInstrumentorClient, GrpcInstrumentorServer
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+# googlecloudprofiler and OpenTelemetry take most of this module's import
+# time, so they are imported when (and only if) they are used
+
+from catalog import AsyncCatalogRefresher, CatalogCache
+import concurrency
+import deterministic
+import metrics
+import prefork
+import profiler
+import readiness
+import resilience
+import result_cache
+import strategies
+import wire
 
 from logger import getJSONLogger
 logger = getJSONLogger('recommendationservice-server')
 
+MAX_BATCH_SIZE = int(os.environ.get('MAX_RECOMMENDATION_BATCH_SIZE', "100"))
+BATCH_TOO_LARGE = "at most {} requests per batch".format(MAX_BATCH_SIZE)
+
 def initStackdriverProfiling():
+  import googlecloudprofiler
+
   project_id = None
   try:
     project_id = os.environ["GCP_PROJECT_ID"]
@@ -64,90 +79,324 @@ def initStackdriverProfiling():
   return
 
 class RecommendationService(demo_pb2_grpc.RecommendationServiceServicer):
-    def ListRecommendations(self, request, context):
+    def __init__(self, catalog, strategies, result_cache=None, seeder=None):
+        self.catalog = catalog
+        self.strategies = strategies
+        self.result_cache = result_cache
+        self.seeder = seeder
+        if seeder is not None:
+            # every artifact version is built with the same arms
+            with strategies.acquire() as split:
+                deterministic.check(split)
+
+    def recommend(self, snapshot, request):
+        """Returns (wire.Recommendation, etag); etag is None unless responses are deterministic."""
+        rng, etag = random, None
         max_responses = 5
-        # fetch list of products from product catalog stub
-        cat_response = product_catalog_stub.ListProducts(demo_pb2.Empty())
-        product_ids = [x.id for x in cat_response.products]
-        filtered_products = list(set(product_ids)-set(request.product_ids))
-        num_products = len(filtered_products)
-        num_return = min(max_responses, num_products)
-        # sample list of indicies to return
-        indices = random.sample(range(num_products), num_return)
-        # fetch product ids from indices
-        prod_list = [filtered_products[i] for i in indices]
-        logger.info("[Recv ListRecommendations] product_ids={}".format(prod_list))
-        # build and return response
-        response = demo_pb2.ListRecommendationsResponse()
-        response.product_ids.extend(prod_list)
-        return response
-
-    def Check(self, request, context):
-        return health_pb2.HealthCheckResponse(
-            status=health_pb2.HealthCheckResponse.SERVING)
-
-    def Watch(self, request, context):
-        return health_pb2.HealthCheckResponse(
-            status=health_pb2.HealthCheckResponse.UNIMPLEMENTED)
+        cache = self.result_cache
+        with self.strategies.acquire() as split:
+            arm = split.arm_for(request.user_id)
+            # split.version is that of the leased artifacts, even mid-swap;
+            # state is ranked with the version the seed was derived from
+            state_version, state = arm.pin(snapshot)
+            if self.seeder is not None:
+                seed, etag = self.seeder.seed(
+                    request, snapshot.version, (split.version, state_version))
+                rng = random.Random(seed)
+            if cache is not None:
+                # cached responses are sent as they are, without serializing;
+                # a deterministic response is fully identified by its etag.
+                # state_version names what the arm really ranks with, e.g. a
+                # popularity table still built for the previous catalog
+                key = etag or cache.key(
+                    request, (snapshot.version, split.version, arm.name, state_version))
+                recommendation = cache.get(key)
+                if recommendation is not None:
+                    return recommendation, etag
+            # rank with the user's arm, skipping requested products
+            prod_list = arm.recommend(
+                snapshot, request.product_ids, max_responses, rng, state)
+        prod_list = strategies.backfill(
+            snapshot, prod_list, max_responses, request.product_ids, rng)
+        # serialize once; the handler returns the bytes as they are
+        recommendation = wire.Recommendation.of(prod_list)
+        if cache is not None:
+            cache.put(key, recommendation)
+        return recommendation, etag
 
+    def recommend_batch(self, snapshot, request):
+        """Returns (serialized ListRecommendationsBatchResponse, etag)."""
+        # every item is answered from the same catalog snapshot
+        results = [self.recommend(snapshot, r) for r in request.requests]
+        payload = wire.encode_batch(r.payload for r, _ in results)
+        etag = None
+        if self.seeder is not None:
+            etag = deterministic.combine_etags(e for _, e in results)
+        logger.info("[Recv ListRecommendationsBatch] requests=%d", len(request.requests))
+        return payload, etag
 
-if __name__ == "__main__":
-    logger.info("initializing recommendationservice")
+    @staticmethod
+    def send_etag(context, etag):
+        if etag is not None:
+            context.set_trailing_metadata((("etag", etag),))
 
-    try:
-      if "DISABLE_PROFILER" in os.environ:
-        raise KeyError()
-      else:
-        logger.info("Profiler enabled.")
-        initStackdriverProfiling()
-    except KeyError:
-        logger.info("Profiler disabled.")
+    def ListRecommendations(self, request, context):
+        recommendation, etag = self.recommend(self.catalog.snapshot(), request)
+        self.send_etag(context, etag)
+        logger.info("[Recv ListRecommendations] product_ids=%s", list(recommendation.product_ids))
+        return recommendation.payload
 
-    try:
-      grpc_client_instrumentor = GrpcInstrumentorClient()
-      grpc_client_instrumentor.instrument()
-      grpc_server_instrumentor = GrpcInstrumentorServer()
-      grpc_server_instrumentor.instrument()
-      if os.environ["ENABLE_TRACING"] == "1":
-        trace.set_tracer_provider(TracerProvider())
-        otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
-        trace.get_tracer_provider().add_span_processor(
-          BatchSpanProcessor(
-              OTLPSpanExporter(
-              endpoint = otel_endpoint,
-              insecure = True
-            )
-          )
-        )
-    except (KeyError, DefaultCredentialsError):
-        logger.info("Tracing disabled.")
-    except Exception as e:
-        logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.") 
+    def ListRecommendationsBatch(self, request, context):
+        if len(request.requests) > MAX_BATCH_SIZE:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, BATCH_TOO_LARGE)
+        payload, etag = self.recommend_batch(self.catalog.snapshot(), request)
+        self.send_etag(context, etag)
+        return payload
 
-    port = os.environ.get('PORT', "8080")
-    catalog_addr = os.environ.get('PRODUCT_CATALOG_SERVICE_ADDR', '')
-    if catalog_addr == "":
-        raise Exception('PRODUCT_CATALOG_SERVICE_ADDR environment variable not set')
-    logger.info("product catalog address: " + catalog_addr)
+
+
+class AsyncRecommendationService(RecommendationService):
+    """RecommendationService for a grpc.aio server."""
+
+    def __init__(self, catalog, strategies, result_cache, seeder, refresher):
+        super().__init__(catalog, strategies, result_cache, seeder)
+        self.refresher = refresher
+
+    async def snapshot(self):
+        snapshot = self.catalog.current()
+        if snapshot is None:
+            snapshot = await self.refresher.load()
+        return snapshot
+
+    async def ListRecommendations(self, request, context):
+        recommendation, etag = self.recommend(await self.snapshot(), request)
+        self.send_etag(context, etag)
+        logger.info("[Recv ListRecommendations] product_ids=%s", list(recommendation.product_ids))
+        return recommendation.payload
+
+    async def ListRecommendationsBatch(self, request, context):
+        if len(request.requests) > MAX_BATCH_SIZE:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, BATCH_TOO_LARGE)
+        payload, etag = self.recommend_batch(await self.snapshot(), request)
+        self.send_etag(context, etag)
+        return payload
+
+
+def serve(port, catalog_addr, refresh_interval):
     channel = grpc.insecure_channel(catalog_addr)
     product_catalog_stub = demo_pb2_grpc.ProductCatalogServiceStub(channel)
 
-    # create gRPC server
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    list_products = resilience.from_environment(
+        "productcatalog", product_catalog_stub.ListProducts, "PRODUCT_CATALOG", logger)
+
+    # keep an in-process catalog snapshot, refreshed in the background; it is
+    # the last-known-good catalog while the breaker is open
+    catalog = CatalogCache(
+        lambda: list_products(demo_pb2.Empty()).products, refresh_interval, logger)
+
+    # create gRPC server; calls beyond GRPC_MAX_CONCURRENT_RPCS (0 for no
+    # bound) are rejected by gRPC itself instead of queueing for a worker
+    max_workers = int(os.environ.get('GRPC_MAX_WORKERS', "10"))
+    max_concurrent_rpcs = int(os.environ.get('GRPC_MAX_CONCURRENT_RPCS', "200")) or None
+    interceptors = []
+    # the adaptive limit starts at, and never exceeds, what the workers can
+    # run at once
+    limiter = concurrency.from_environment(max_workers, max_workers)
+    if limiter is not None:
+        interceptors.append(concurrency.ConcurrencyLimitInterceptor(limiter))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                         interceptors=interceptors,
+                         options=[("grpc.so_reuseport", 1)],
+                         maximum_concurrent_rpcs=max_concurrent_rpcs)
 
     # add class to gRPC server
-    service = RecommendationService()
-    demo_pb2_grpc.add_RecommendationServiceServicer_to_server(service, server)
-    health_pb2_grpc.add_HealthServicer_to_server(service, server)
+    service = RecommendationService(
+        catalog, strategies.from_environment(logger), result_cache.from_environment(),
+        deterministic.from_environment())
+    wire.add_RecommendationServiceServicer_to_server(service, server)
+    health_servicer = health.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    ready = readiness.Readiness([wire.SERVICE], [lambda: catalog.current() is not None])
+    ready.serve(health_servicer)
 
     # start server
     logger.info("listening on port: " + port)
     server.add_insecure_port('[::]:'+port)
     server.start()
+    startObservability()
+
+    # warm up while health checks report NOT_SERVING
+    catalog.start()
+    ready.poke()
 
     # keep alive
     try:
          while True:
             time.sleep(10000)
     except KeyboardInterrupt:
-            server.stop(0)
+            ready.stop()
+            catalog.stop()
+            # let in-flight calls finish; new calls are refused meanwhile
+            server.stop(prefork.stop_grace()).wait()
+
+
+async def serve_async(port, catalog_addr, refresh_interval):
+    channel = grpc.aio.insecure_channel(catalog_addr)
+    product_catalog_stub = demo_pb2_grpc.ProductCatalogServiceStub(channel)
+
+    list_products = resilience.from_environment(
+        "productcatalog", product_catalog_stub.ListProducts, "PRODUCT_CATALOG", logger)
+
+    async def fetch_products():
+        response = await list_products.call_async(demo_pb2.Empty())
+        return response.products
+
+    # the snapshot is refreshed by a task on the server's event loop
+    catalog = CatalogCache(None, refresh_interval, logger)
+    refresher = AsyncCatalogRefresher(catalog, fetch_products, refresh_interval, logger)
+
+    interceptors = []
+    limiter = concurrency.from_environment(100)
+    if limiter is not None:
+        interceptors.append(concurrency.AsyncConcurrencyLimitInterceptor(limiter))
+    server = grpc.aio.server(
+        interceptors=interceptors,
+        options=[("grpc.so_reuseport", 1)],
+        maximum_concurrent_rpcs=int(os.environ.get('GRPC_MAX_CONCURRENT_RPCS', "200")) or None)
+    service = AsyncRecommendationService(
+        catalog, strategies.from_environment(logger), result_cache.from_environment(),
+        deterministic.from_environment(), refresher)
+    wire.add_RecommendationServiceServicer_to_server(service, server)
+    health_servicer = health.aio.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    ready = readiness.Readiness([wire.SERVICE], [lambda: catalog.current() is not None])
+    ready_task = asyncio.create_task(ready.serve_async(health_servicer))
+
+    logger.info("listening on port (asyncio): " + port)
+    server.add_insecure_port('[::]:'+port)
+    await server.start()
+    startObservability()
+
+    # stop from the event loop, so the signal does not interrupt a handler
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    # warm up while health checks report NOT_SERVING
+    await refresher.start()
+    ready.poke()
+    try:
+        await stopping.wait()
+    finally:
+        ready.stop()
+        await ready_task
+        refresher.stop()
+        await server.stop(prefork.stop_grace())
+        await channel.close()
+
+
+def initTracing(async_server):
+    """Instruments gRPC; must run before the server and channels are created.
+
+    Spans go to the global tracer provider, which initTraceExport sets up
+    once the server is listening.
+    """
+    if os.environ.get("ENABLE_TRACING") != "1":
+        logger.info("Tracing disabled.")
+        return
+    try:
+      from opentelemetry.instrumentation.grpc import (
+          GrpcAioInstrumentorClient, GrpcAioInstrumentorServer,
+          GrpcInstrumentorClient, GrpcInstrumentorServer, filters)
+
+      # health probes are not worth a span, and the asyncio server
+      # interceptor cannot wrap the health servicer's streaming Watch
+      untraced_health = filters.negate(filters.health_check())
+      if async_server:
+        grpc_client_instrumentor = GrpcAioInstrumentorClient()
+        grpc_server_instrumentor = GrpcAioInstrumentorServer(filter_=untraced_health)
+      else:
+        grpc_client_instrumentor = GrpcInstrumentorClient()
+        grpc_server_instrumentor = GrpcInstrumentorServer(filter_=untraced_health)
+      grpc_client_instrumentor.instrument()
+      grpc_server_instrumentor.instrument()
+    except Exception as e:
+        logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.")
+
+
+def initTraceExport():
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+    trace.set_tracer_provider(TracerProvider())
+    otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
+    trace.get_tracer_provider().add_span_processor(
+      BatchSpanProcessor(
+          OTLPSpanExporter(
+          endpoint = otel_endpoint,
+          insecure = True
+        )
+      )
+    )
+
+
+def initObservability():
+    """Starts the profiler agent and trace export, which may block on the network."""
+    if "DISABLE_PROFILER" in os.environ:
+        logger.info("Profiler disabled.")
+    else:
+        logger.info("Profiler enabled.")
+        initStackdriverProfiling()
+
+    if os.environ.get("ENABLE_TRACING") == "1":
+        try:
+            initTraceExport()
+        except Exception as e:
+            logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.")
+
+
+def startObservability():
+    """Runs initObservability in the background so it does not delay readiness."""
+    threading.Thread(target=initObservability, name="observability-init", daemon=True).start()
+
+
+def run(async_server, port, catalog_addr, refresh_interval):
+    """Runs one server process; under prefork this is called in each worker."""
+    profiler.install(logger)
+
+    initTracing(async_server)
+    metrics.start_reporter(
+        logger, float(os.environ.get('METRICS_REPORT_INTERVAL_SECONDS', "60")))
+
+    if async_server:
+        try:
+            asyncio.run(serve_async(port, catalog_addr, refresh_interval))
+        except KeyboardInterrupt:
+            pass
+    else:
+        serve(port, catalog_addr, refresh_interval)
+
+
+if __name__ == "__main__":
+    logger.info("initializing recommendationservice")
+    async_server = os.environ.get("ENABLE_ASYNC_SERVER", "0") == "1"
+
+    port = os.environ.get('PORT', "8080")
+    catalog_addr = os.environ.get('PRODUCT_CATALOG_SERVICE_ADDR', '')
+    if catalog_addr == "":
+        raise Exception('PRODUCT_CATALOG_SERVICE_ADDR environment variable not set')
+    logger.info("product catalog address: " + catalog_addr)
+    refresh_interval = float(os.environ.get('CATALOG_REFRESH_INTERVAL_SECONDS', "60"))
+
+    if prefork.enabled():
+        # fork before any gRPC, tracing or profiler state is created
+        prefork.Supervisor(
+            lambda: run(async_server, port, catalog_addr, refresh_interval),
+            prefork.worker_count(), logger).run()
+    else:
+        # stop on SIGTERM through the same path as the prefork workers
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        run(async_server, port, catalog_addr, refresh_interval)
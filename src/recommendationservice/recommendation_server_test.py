@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+
+import grpc
+import pytest
+
+import demo_pb2
+from catalog import CatalogCache
+from logger import getJSONLogger
+from metrics import REGISTRY
+from popularity import FileWeights, PopularityStrategy
+from recommendation_server import MAX_BATCH_SIZE, RecommendationService
+from result_cache import ResultCache
+from strategies import Arm, RandomStrategy, StrategyHolder, TrafficSplit
+
+logger = getJSONLogger('recommendationservice-test')
+
+
+def catalog_of(n):
+    catalog = CatalogCache(
+        lambda: [demo_pb2.Product(id="p{}".format(i)) for i in range(n)], 60, logger)
+    catalog.refresh()
+    return catalog
+
+
+def write_weights(path, weights):
+    with open(path, "w") as f:
+        json.dump(weights, f)
+
+
+def test_reloaded_weights_miss_the_result_cache(tmp_path):
+    path = str(tmp_path / "popularity.json")
+    write_weights(path, {"p1": 5})
+    strategy = PopularityStrategy(FileWeights(path), refresh_interval=0)
+    split = TrafficSplit([Arm("popularity", strategy, 1)])
+    catalog = catalog_of(20)
+    service = RecommendationService(catalog, StrategyHolder(split), ResultCache(100, 60))
+    request = demo_pb2.ListRecommendationsRequest(user_id="u", product_ids=["p0"])
+    misses = REGISTRY.counter("result_cache_misses_total")
+    snapshot = catalog.snapshot()
+
+    service.recommend(snapshot, request)
+    before = misses.value
+    service.recommend(snapshot, request)
+    assert misses.value == before
+
+    old_version, _ = strategy.pin(snapshot)
+    write_weights(path, {"p2": 5, "p3": 1})
+    deadline = time.monotonic() + 5
+    # the table is rebuilt by a background thread
+    while strategy.pin(snapshot)[0] == old_version:
+        assert time.monotonic() < deadline, "weights were not reloaded"
+        time.sleep(0.01)
+    service.recommend(snapshot, request)
+    assert misses.value == before + 1
+
+
+class StaticWeights(object):
+    def current(self):
+        return "w1", {"p1": 5}
+
+
+def test_results_from_a_stale_table_are_not_cached_for_the_new_catalog():
+    strategy = PopularityStrategy(StaticWeights())
+    split = TrafficSplit([Arm("popularity", strategy, 1)])
+    service = RecommendationService(
+        catalog_of(5), StrategyHolder(split), ResultCache(100, 60))
+    request = demo_pb2.ListRecommendationsRequest(user_id="u", product_ids=["p0"])
+    misses = REGISTRY.counter("result_cache_misses_total")
+    old, new = catalog_of(5).snapshot(), catalog_of(50).snapshot()
+    service.recommend(old, request)
+
+    # drawn from the table of the old catalog while the new one is built
+    before = misses.value
+    service.recommend(new, request)
+    assert misses.value == before + 1
+    deadline = time.monotonic() + 5
+    while strategy.pin(new)[0][0] != new.version:
+        assert time.monotonic() < deadline, "table was not rebuilt"
+        time.sleep(0.01)
+    service.recommend(new, request)
+    assert misses.value == before + 2
+
+
+class AbortingContext(object):
+    def abort(self, code, details):
+        raise RuntimeError(code, details)
+
+
+def test_batch_answers_each_request_in_order():
+    split = TrafficSplit([Arm("random", RandomStrategy(), 1)])
+    catalog = catalog_of(20)
+    service = RecommendationService(catalog, StrategyHolder(split))
+    requests = [demo_pb2.ListRecommendationsRequest(user_id="u", product_ids=[p])
+                for p in ("p0", "p1", "p2")]
+    payload, etag = service.recommend_batch(
+        catalog.snapshot(), demo_pb2.ListRecommendationsBatchRequest(requests=requests))
+
+    responses = demo_pb2.ListRecommendationsBatchResponse.FromString(payload).responses
+    assert etag is None
+    assert len(responses) == 3
+    for request, response in zip(requests, responses):
+        assert len(set(response.product_ids)) == 5
+        assert request.product_ids[0] not in response.product_ids
+
+
+def test_batch_rejects_too_many_requests():
+    service = RecommendationService(
+        catalog_of(20), StrategyHolder(TrafficSplit([Arm("random", RandomStrategy(), 1)])))
+    request = demo_pb2.ListRecommendationsBatchRequest(requests=[
+        demo_pb2.ListRecommendationsRequest(user_id="u")] * (MAX_BATCH_SIZE + 1))
+    with pytest.raises(RuntimeError) as raised:
+        service.ListRecommendationsBatch(request, AbortingContext())
+    assert raised.value.args[0] == grpc.StatusCode.INVALID_ARGUMENT
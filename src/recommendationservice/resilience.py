@@ -0,0 +1,261 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client-side resilience for calls to other services.
+
+A ResilientCall wraps a gRPC stub method with:
+
+- a deadline covering the call and all of its retries,
+- retries with full-jitter exponential backoff, limited by a RetryBudget so
+  retries can add at most a fraction of extra load to a struggling server,
+- a CircuitBreaker that fails calls immediately after repeated failures and
+  lets a single probe through once the reset timeout has passed.
+
+Callers keep their own last-known-good data (LastKnownGood, or a snapshot)
+to serve while the dependency is unavailable.
+"""
+
+import asyncio
+import collections
+import os
+import random
+import threading
+import time
+
+import grpc
+
+# failures that say something about the dependency's health; anything
+# else (NOT_FOUND, INVALID_ARGUMENT, ...) is the caller's problem
+RETRYABLE_CODES = frozenset([
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+])
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def unavailable(exc):
+    """Whether exc means the dependency could not answer, not that it refused.
+
+    Only then is a stale fallback better than the error.
+    """
+    if isinstance(exc, CircuitOpenError):
+        return True
+    return isinstance(exc, grpc.RpcError) and exc.code() in RETRYABLE_CODES
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30,
+                 logger=None, clock=time.monotonic):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._logger = logger
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+
+    def allow(self):
+        """Returns True if a call may be attempted now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and \
+                    self._clock() - self._opened_at >= self._reset_timeout:
+                # let exactly one probe through
+                self._transition(self.HALF_OPEN)
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self._failures >= self._failure_threshold):
+                self._opened_at = self._clock()
+                self._transition(self.OPEN)
+
+    def _transition(self, state):
+        self.state = state
+        if self._logger is not None:
+            self._logger.warning("Circuit breaker {} is now {}".format(self.name, state))
+
+
+class RetryBudget(object):
+    """Allows retries up to `ratio` of recent calls, plus `min_per_second`."""
+
+    def __init__(self, ratio=0.2, min_per_second=1, max_tokens=10, clock=time.monotonic):
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated_at = clock()
+
+    def deposit(self):
+        """Called once per original (non-retry) call."""
+        with self._lock:
+            self._refill(self._ratio)
+
+    def withdraw(self):
+        """Returns True if a retry may be made, spending one token."""
+        with self._lock:
+            self._refill(0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _refill(self, amount):
+        now = self._clock()
+        amount += (now - self._updated_at) * self._min_per_second
+        self._updated_at = now
+        self._tokens = min(self._max_tokens, self._tokens + amount)
+
+
+class ResilientCall(object):
+    """Calls `method(request, timeout=...)` under a deadline, retries and breaker."""
+
+    def __init__(self, name, method, deadline, breaker, budget,
+                 max_attempts=3, base_backoff=0.05, rng=random):
+        self.name = name
+        self._method = method
+        self._deadline = deadline
+        self._breaker = breaker
+        self._budget = budget
+        self._max_attempts = max_attempts
+        self._base_backoff = base_backoff
+        self._rng = rng
+
+    def _backoff(self, attempt, remaining):
+        return min(remaining, self._rng.uniform(0, self._base_backoff * 2 ** attempt))
+
+    def _should_retry(self, attempt, remaining):
+        return (attempt + 1 < self._max_attempts and remaining > 0
+                and self._budget.withdraw())
+
+    def _begin(self):
+        if not self._breaker.allow():
+            raise CircuitOpenError("circuit breaker {} is open".format(self.name))
+        self._budget.deposit()
+        return time.monotonic() + self._deadline
+
+    def _failed(self, exc):
+        """Records exc and returns True if it is worth retrying."""
+        if isinstance(exc, grpc.RpcError) and exc.code() not in RETRYABLE_CODES:
+            # the dependency answered; this call is just not going to work
+            self._breaker.record_success()
+            return False
+        self._breaker.record_failure()
+        return True
+
+    def __call__(self, request):
+        expires = self._begin()
+        attempt = 0
+        while True:
+            try:
+                response = self._method(request, timeout=max(0, expires - time.monotonic()))
+            except Exception as exc:
+                remaining = expires - time.monotonic()
+                if not self._failed(exc) or not self._should_retry(attempt, remaining):
+                    raise
+                if not self._breaker.allow():
+                    raise CircuitOpenError(
+                        "circuit breaker {} is open".format(self.name)) from exc
+                time.sleep(self._backoff(attempt, remaining))
+                attempt += 1
+                continue
+            self._breaker.record_success()
+            return response
+
+    async def call_async(self, request):
+        """Like __call__, for grpc.aio stub methods."""
+        expires = self._begin()
+        attempt = 0
+        while True:
+            try:
+                response = await self._method(
+                    request, timeout=max(0, expires - time.monotonic()))
+            except Exception as exc:
+                remaining = expires - time.monotonic()
+                if not self._failed(exc) or not self._should_retry(attempt, remaining):
+                    raise
+                if not self._breaker.allow():
+                    raise CircuitOpenError(
+                        "circuit breaker {} is open".format(self.name)) from exc
+                await asyncio.sleep(self._backoff(attempt, remaining))
+                attempt += 1
+                continue
+            self._breaker.record_success()
+            return response
+
+
+class LastKnownGood(object):
+    """Bounded LRU of the latest successful result per key."""
+
+    def __init__(self, capacity=1000):
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+
+def from_environment(name, method, prefix, logger=None):
+    """Builds a ResilientCall configured by {prefix}_* environment variables.
+
+    {prefix}_DEADLINE_SECONDS (default 2) bounds the call including retries,
+    {prefix}_MAX_ATTEMPTS (3) and {prefix}_RETRY_BUDGET_RATIO (0.2) limit
+    retries, and the breaker opens after {prefix}_BREAKER_FAILURES (5)
+    consecutive failures for {prefix}_BREAKER_RESET_SECONDS (30).
+    """
+    def env(key, default):
+        return float(os.environ.get("{}_{}".format(prefix, key), default))
+
+    breaker = CircuitBreaker(
+        name, int(env("BREAKER_FAILURES", "5")), env("BREAKER_RESET_SECONDS", "30"), logger)
+    budget = RetryBudget(env("RETRY_BUDGET_RATIO", "0.2"))
+    return ResilientCall(
+        name, method, env("DEADLINE_SECONDS", "2"), breaker, budget,
+        int(env("MAX_ATTEMPTS", "3")))
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grpc
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCall, RetryBudget
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class Flaky(object):
+    """Fails with `errors` in turn, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, request, timeout):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # only one probe at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 15
+    assert not breaker.allow()
+
+
+def test_retry_budget_runs_out_and_refills():
+    clock = Clock()
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2, clock=clock)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def call(method, budget=None, max_attempts=3):
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    budget = budget or RetryBudget()
+    return ResilientCall("test", method, 5, breaker, budget, max_attempts, base_backoff=0), breaker
+
+
+def test_retries_retryable_errors():
+    method = Flaky(RpcError(grpc.StatusCode.UNAVAILABLE), RpcError(grpc.StatusCode.UNAVAILABLE))
+    resilient, _ = call(method)
+    assert resilient("request") == "ok"
+    assert method.calls == 3
+
+
+def test_does_not_retry_or_count_errors_the_dependency_answered():
+    method = Flaky(RpcError(grpc.StatusCode.NOT_FOUND))
+    resilient, breaker = call(method)
+    with pytest.raises(grpc.RpcError):
+        resilient("request")
+    assert method.calls == 1
+    assert breaker._failures == 0
+
+
+def test_exhausted_budget_stops_retries():
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    method = Flaky(*[RpcError(grpc.StatusCode.UNAVAILABLE)] * 5)
+    resilient, _ = call(method, budget, max_attempts=5)
+    with pytest.raises(grpc.RpcError):
+        resilient("request")
+    # the original call plus the one retry the budget allowed
+    assert method.calls == 2
+
+
+def test_open_breaker_fails_fast():
+    method = Flaky()
+    resilient, breaker = call(method)
+    for _ in range(5):
+        breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        resilient("request")
+    assert method.calls == 0
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded LRU + TTL cache of ListRecommendations results.
+
+Shoppers looking at the same products send identical product id sets, so
+results are cached under the frozen set of requested ids, the versions of
+the catalog snapshot, the strategy that produced them and any state it
+reloads (popularity weights) and, optionally, a coarse user segment. Entries
+hold the serialized response, so a hit is sent without serializing it again.
+"""
+
+import collections
+import os
+import threading
+import time
+import zlib
+
+from metrics import REGISTRY
+
+
+class ResultCache(object):
+    def __init__(self, capacity, ttl, segments=0, clock=time.monotonic):
+        self._capacity = capacity
+        self._ttl = ttl
+        self._segments = segments
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (expires, value)
+        self._hits = REGISTRY.counter("result_cache_hits_total")
+        self._misses = REGISTRY.counter("result_cache_misses_total")
+        self._evictions = REGISTRY.counter("result_cache_evictions_total")
+        REGISTRY.gauge("result_cache_entries", fn=lambda: len(self._entries))
+
+    def key(self, request, version):
+        segment = None
+        if self._segments:
+            segment = zlib.crc32(request.user_id.encode("utf-8")) % self._segments
+        return frozenset(request.product_ids), segment, version
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._hits.inc()
+                    return entry[1]
+                del self._entries[key]
+                self._evictions.inc()
+        self._misses.inc()
+        return None
+
+    def put(self, key, value):
+        expires = self._clock() + self._ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._evictions.inc()
+
+
+def from_environment():
+    """Returns a ResultCache, or None when RESULT_CACHE_SIZE is 0 (default)."""
+    capacity = int(os.environ.get("RESULT_CACHE_SIZE", "0"))
+    if capacity <= 0:
+        return None
+    return ResultCache(
+        capacity,
+        float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "30")),
+        int(os.environ.get("RESULT_CACHE_USER_SEGMENTS", "0")))
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Uniform sampling of product ids with exclusions.
+
+The ProductIndex is built once per catalog snapshot, so a request only pays
+for the items it draws and the ids it excludes, never for the catalog size.
+"""
+
+import random
+
+
+class ProductIndex(object):
+    """Array-backed product ids with an id -> position lookup."""
+
+    __slots__ = ("ids", "positions")
+
+    def __init__(self, product_ids):
+        self.ids = tuple(product_ids)
+        self.positions = {product_id: i for i, product_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def excluded_positions(self, product_ids):
+        positions = self.positions
+        return {positions[p] for p in product_ids if p in positions}
+
+
+def sample_positions(n, k, excluded=frozenset(), rng=random):
+    """Draws up to k distinct positions from range(n), skipping `excluded`.
+
+    Runs a partial Fisher-Yates shuffle over a virtual array, recording only
+    the swapped slots in a dict. Every step consumes one position, so the
+    loop runs at most k + len(excluded) times.
+    """
+    k = min(k, n - len(excluded))
+    swapped = {}
+    picked = []
+    i = 0
+    while len(picked) < k:
+        j = rng.randrange(i, n)
+        chosen = swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+        i += 1
+        if chosen not in excluded:
+            picked.append(chosen)
+    return picked
+
+
+def sample_excluding(index, k, excluded_ids=(), rng=random):
+    """Returns up to k distinct ids from `index` that are not in `excluded_ids`."""
+    excluded = index.excluded_positions(excluded_ids)
+    ids = index.ids
+    return [ids[i] for i in sample_positions(len(ids), k, excluded, rng)]
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares set-difference sampling with ProductIndex sampling.
+
+Usage: python sampling_benchmark.py [iterations]
+"""
+
+import random
+import sys
+import timeit
+
+from sampling import ProductIndex, sample_excluding
+
+K = 5
+EXCLUDED = 3
+
+
+def set_difference_sample(product_ids, excluded_ids, k):
+    filtered_products = list(set(product_ids) - set(excluded_ids))
+    num_products = len(filtered_products)
+    indices = random.sample(range(num_products), min(k, num_products))
+    return [filtered_products[i] for i in indices]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("{:>10} {:>18} {:>18} {:>10}".format(
+        "catalog", "set diff (us/op)", "index (us/op)", "speedup"))
+    for size in (10, 10000, 1000000):
+        product_ids = ["P{:09d}".format(i) for i in range(size)]
+        index = ProductIndex(product_ids)
+        excluded_ids = random.sample(product_ids, EXCLUDED)
+
+        before = timeit.timeit(
+            lambda: set_difference_sample(product_ids, excluded_ids, K),
+            number=iterations) / iterations
+        after = timeit.timeit(
+            lambda: sample_excluding(index, K, excluded_ids),
+            number=iterations) / iterations
+        print("{:>10} {:>18.2f} {:>18.2f} {:>9.1f}x".format(
+            size, before * 1e6, after * 1e6, before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import random
+
+import pytest
+
+from sampling import ProductIndex, sample_excluding, sample_positions
+
+
+@pytest.mark.parametrize("n,k,excluded", [
+    (10, 5, set()), (10, 10, set()), (10, 5, {0, 3, 9}), (10, 8, {1, 2, 3}), (3, 5, set())])
+def test_sample_positions_draws_distinct_positions_outside_excluded(n, k, excluded):
+    rng = random.Random(7)
+    for _ in range(200):
+        picked = sample_positions(n, k, excluded, rng)
+        assert len(picked) == min(k, n - len(excluded))
+        assert len(set(picked)) == len(picked)
+        assert all(0 <= p < n and p not in excluded for p in picked)
+
+
+def test_sample_positions_is_uniform():
+    rng = random.Random(11)
+    counts = collections.Counter()
+    draws = 20000
+    for _ in range(draws):
+        counts.update(sample_positions(10, 2, {4}, rng))
+    expected = draws * 2 / 9
+    assert set(counts) == set(range(10)) - {4}
+    assert all(abs(c - expected) < 0.05 * expected for c in counts.values())
+
+
+def test_sample_excluding_skips_requested_and_unknown_ids():
+    index = ProductIndex(["a", "b", "c", "d"])
+    for seed in range(50):
+        picked = sample_excluding(index, 4, ["b", "zz"], random.Random(seed))
+        assert sorted(picked) == ["a", "c", "d"]
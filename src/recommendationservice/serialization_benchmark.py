@@ -0,0 +1,73 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares sending cached messages with sending pre-serialized bytes.
+
+For a cache hit, the message path serializes the cached response on every
+call; the bytes path hands it to gRPC as it is. Batches compare building
+a ListRecommendationsBatchResponse message with concatenating cached item
+encodings. Usage: python serialization_benchmark.py [iterations]
+"""
+
+import sys
+import timeit
+
+import demo_pb2
+import wire
+
+IDS = ["OLJCESPC7Z", "66VCHSJNUP", "1YMWWN1N4O", "L9ECAV7KIM", "2ZYFJ3GM2N"]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    message = demo_pb2.ListRecommendationsResponse(product_ids=IDS)
+    recommendation = wire.Recommendation.of(IDS)
+    identity = wire._identity
+    assert recommendation.payload == message.SerializeToString()
+
+    def per_call(fn):
+        return timeit.timeit(fn, number=iterations) / iterations * 1e6
+
+    print("{:>22} {:>14} {:>14}".format("", "message (us)", "bytes (us)"))
+    print("{:>22} {:>14.3f} {:>14.3f}".format(
+        "cache hit", per_call(message.SerializeToString),
+        per_call(lambda: identity(recommendation.payload))))
+    print("{:>22} {:>14.3f} {:>14.3f}".format(
+        "cache miss",
+        per_call(lambda: demo_pb2.ListRecommendationsResponse(
+            product_ids=IDS).SerializeToString()),
+        per_call(lambda: wire.Recommendation.of(IDS))))
+
+    for size in (10, 100):
+        messages = [message] * size
+        payloads = [recommendation.payload] * size
+
+        def batch_message():
+            response = demo_pb2.ListRecommendationsBatchResponse()
+            response.responses.extend(messages)
+            return response.SerializeToString()
+
+        assert batch_message() == wire.encode_batch(payloads)
+        batch_iterations = max(1, iterations // size)
+        print("{:>22} {:>14.3f} {:>14.3f}".format(
+            "batch of {} hits".format(size),
+            timeit.timeit(batch_message, number=batch_iterations) / batch_iterations * 1e6,
+            timeit.timeit(lambda: wire.encode_batch(payloads),
+                          number=batch_iterations) / batch_iterations * 1e6))
+
+
+if __name__ == "__main__":
+    main()
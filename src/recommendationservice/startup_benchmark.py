@@ -0,0 +1,120 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures how long a new recommendationservice process takes to become ready.
+
+Starts the server against an in-process fake product catalog and polls the
+gRPC health service until it reports SERVING, and separately times importing
+recommendation_server. The server inherits this process's environment, so
+DISABLE_PROFILER, ENABLE_TRACING, ENABLE_ASYNC_SERVER etc. can be compared.
+Exits with status 1 if the median import time exceeds the budget, so the
+check can run in CI.
+Usage: python startup_benchmark.py [runs] [import budget seconds]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent import futures
+
+import grpc
+from grpc_health.v1 import health_pb2
+from grpc_health.v1 import health_pb2_grpc
+
+import demo_pb2
+import demo_pb2_grpc
+
+SERVER_PORT = "18089"
+CATALOG_PORT = "13550"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# reconnect quickly while the server is not listening yet, instead of
+# after gRPC's default backoff of a second or more
+CHANNEL_OPTIONS = [
+    ("grpc.initial_reconnect_backoff_ms", 5),
+    ("grpc.min_reconnect_backoff_ms", 5),
+    ("grpc.max_reconnect_backoff_ms", 5),
+]
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import recommendation_server; "
+    "print(time.perf_counter() - started)")
+
+
+class FakeCatalog(demo_pb2_grpc.ProductCatalogServiceServicer):
+    def ListProducts(self, request, context):
+        return demo_pb2.ListProductsResponse(products=[
+            demo_pb2.Product(id="product-{}".format(i), categories=["benchmark"])
+            for i in range(100)])
+
+
+def import_seconds():
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=HERE, stderr=subprocess.DEVNULL)
+    return float(output)
+
+
+def seconds_to_serving(timeout=60):
+    env = dict(os.environ, PORT=SERVER_PORT,
+               PRODUCT_CATALOG_SERVICE_ADDR="localhost:" + CATALOG_PORT)
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "recommendation_server.py"], cwd=HERE, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with grpc.insecure_channel("localhost:" + SERVER_PORT, CHANNEL_OPTIONS) as channel:
+            stub = health_pb2_grpc.HealthStub(channel)
+            while time.perf_counter() - started < timeout:
+                try:
+                    response = stub.Check(health_pb2.HealthCheckRequest(), timeout=1)
+                    if response.status == health_pb2.HealthCheckResponse.SERVING:
+                        return time.perf_counter() - started
+                except grpc.RpcError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError("server did not become SERVING in {}s".format(timeout))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    catalog = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    demo_pb2_grpc.add_ProductCatalogServiceServicer_to_server(FakeCatalog(), catalog)
+    catalog.add_insecure_port("localhost:" + CATALOG_PORT)
+    catalog.start()
+    try:
+        imports = [import_seconds() for _ in range(runs)]
+        serving = [seconds_to_serving() for _ in range(runs)]
+    finally:
+        catalog.stop(0)
+
+    print("{:>24} {:>10} {:>10} {:>10}".format("", "median ms", "min ms", "max ms"))
+    for name, samples in (("import", imports), ("time to first SERVING", serving)):
+        print("{:>24} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name, statistics.median(samples) * 1e3, min(samples) * 1e3, max(samples) * 1e3))
+    if statistics.median(imports) > budget:
+        print("import time exceeds the budget of {:.0f} ms".format(budget * 1e3))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
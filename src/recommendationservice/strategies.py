@@ -0,0 +1,295 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Recommendation strategies.
+
+A strategy returns up to k product ids for a request, never including the
+requested products. It may return fewer; the service backfills the rest
+with uniform samples from the catalog snapshot.
+
+Strategies are selected by name with RECOMMENDATION_STRATEGY, or split
+across weighted arms with RECOMMENDATION_STRATEGIES ("random=50,content=50").
+Users are assigned to an arm by a hash of their user id, so each shopper
+sees one algorithm consistently. Every arm records its own latency histogram
+and error counter. Factories import their modules lazily so unused models
+cost nothing at startup. Requests borrow the split through a holder's
+acquire(), which lets an ArtifactStore swap models underneath without
+disturbing in-flight requests.
+"""
+
+import bisect
+import contextlib
+import os
+import random
+import time
+import zlib
+
+from metrics import REGISTRY
+from sampling import sample_excluding
+
+
+class RandomStrategy(object):
+    """Uniform sampling over the catalog snapshot."""
+
+    name = "random"
+
+    def recommend(self, snapshot, product_ids, k, rng=random):
+        return sample_excluding(snapshot.index, k, product_ids, rng)
+
+
+class ScoredStrategy(object):
+    """Base for strategies that rank candidates with a model.
+
+    Subclasses implement candidates(product_ids, n), returning up to n
+    (product id, score) pairs best first, none of them requested. Models are
+    built offline and may name products the catalog no longer has.
+    """
+
+    def candidates(self, product_ids, n):
+        raise NotImplementedError
+
+    def recommend(self, snapshot, product_ids, k, rng=None):
+        # over-fetch so products missing from the catalog can be dropped
+        positions = snapshot.index.positions
+        scored = self.candidates(product_ids, 2 * k)
+        return [p for p, _ in scored if p in positions][:k]
+
+
+def backfill(snapshot, picked, k, product_ids, rng=random):
+    """Tops `picked` up to k ids with uniform samples, avoiding duplicates."""
+    missing = k - len(picked)
+    if missing <= 0:
+        return picked[:k]
+    excluded = list(product_ids)
+    excluded.extend(picked)
+    return picked + sample_excluding(snapshot.index, missing, excluded, rng)
+
+
+class Arm(object):
+    """One strategy of a traffic split, with its own latency and error metrics."""
+
+    def __init__(self, name, strategy, weight, logger=None):
+        self.name = name
+        self.strategy = strategy
+        self.weight = weight
+        # False if answers depend on live state, such as trending counters
+        self.deterministic = getattr(strategy, "deterministic", True)
+        self._logger = logger
+        labels = {"arm": name}
+        self._latency = REGISTRY.histogram("recommendation_arm_latency_seconds", labels)
+        self._errors = REGISTRY.counter("recommendation_arm_errors_total", labels)
+
+    def pin(self, snapshot):
+        """Returns (version, state) of state the strategy reloads by itself.
+
+        Passing `state` back to recommend() ranks with exactly the version
+        returned, even if a reload lands in between. Both are None for
+        strategies without such state.
+        """
+        pin = getattr(self.strategy, "pin", None)
+        return pin(snapshot) if pin is not None else (None, None)
+
+    def recommend(self, snapshot, product_ids, k, rng=random, state=None):
+        """Returns the strategy's picks, or [] if it raised.
+
+        A failing arm degrades to the uniform backfill instead of failing
+        the request; the error counter shows how often that happens.
+        """
+        start = time.perf_counter()
+        try:
+            if state is not None:
+                return self.strategy.recommend(snapshot, product_ids, k, rng, state)
+            return self.strategy.recommend(snapshot, product_ids, k, rng)
+        except Exception as exc:
+            self._errors.inc()
+            if self._logger is not None:
+                self._logger.warning("Strategy %s failed: %s", self.name, exc)
+            return []
+        finally:
+            self._latency.observe(time.perf_counter() - start)
+
+
+class TrafficSplit(object):
+    """Assigns each user id to one of several weighted arms."""
+
+    def __init__(self, arms, version=None):
+        """`version` names the artifacts the arms were built from, if any."""
+        if not arms:
+            raise ValueError("traffic split needs at least one arm")
+        self.arms = arms
+        if len(arms) == 1:
+            self.name = arms[0].name
+        else:
+            self.name = ",".join("{}={}".format(a.name, a.weight) for a in arms)
+        self.version = version or self.name
+        self._bounds = []
+        total = 0
+        for arm in arms:
+            total += arm.weight
+            self._bounds.append(total)
+        self._total = total
+
+    def arm_for(self, user_id):
+        if len(self.arms) == 1:
+            return self.arms[0]
+        # salted so arms are independent of the result cache's user segments
+        bucket = zlib.crc32(b"arm:" + user_id.encode("utf-8")) % self._total
+        return self.arms[bisect.bisect_right(self._bounds, bucket)]
+
+
+def parse_split(spec):
+    """Parses "name=weight,..." into [(name, weight)]; a bare name weighs 1.
+
+    Arms with weight 0 are dropped, so an arm can be switched off without
+    removing it from the configuration.
+    """
+    arms = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        weight = int(weight) if weight.strip() else 1
+        if weight < 0:
+            raise ValueError("negative weight for strategy " + name)
+        if name not in STRATEGIES:
+            raise ValueError("unknown recommendation strategy: " + name)
+        if any(name == other for other, _ in arms):
+            raise ValueError("strategy listed twice: " + name)
+        if weight:
+            arms.append((name, weight))
+    if not arms:
+        raise ValueError("no recommendation strategy with a positive weight in " + repr(spec))
+    return arms
+
+
+class StrategyHolder(object):
+    """Hands out a split that never changes for the life of the process."""
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    @contextlib.contextmanager
+    def acquire(self):
+        yield self.strategy
+
+
+def _model_path(models_dir, filename, env):
+    """Model files come from an artifact version directory, else from env."""
+    if models_dir is not None:
+        return os.path.join(models_dir, filename)
+    return os.environ[env]
+
+
+def _random(models_dir, logger):
+    return RandomStrategy()
+
+
+def _category(models_dir, logger):
+    from category_index import CategoryStrategy
+    return CategoryStrategy()
+
+
+def _popularity(models_dir, logger):
+    from popularity import FileWeights, PopularityStrategy
+    if os.environ.get("POPULARITY_SOURCE", "file") == "trending":
+        # live counters; products outside the top-k keep the default weight
+        from trending import shared_counter
+        source = shared_counter(logger)
+    else:
+        source = FileWeights(
+            _model_path(models_dir, "popularity.json", "POPULARITY_WEIGHTS_PATH"))
+    return PopularityStrategy(
+        source, float(os.environ.get("POPULARITY_DEFAULT_WEIGHT", "1")))
+
+
+def _trending(models_dir, logger):
+    from trending import TrendingStrategy, shared_counter
+    return TrendingStrategy(shared_counter(logger))
+
+
+def _cooccurrence(models_dir, logger):
+    from cooccurrence import CooccurrenceModel, CooccurrenceStrategy
+    return CooccurrenceStrategy(CooccurrenceModel.load(
+        _model_path(models_dir, "cooccurrence.bin", "COOCCURRENCE_MODEL_PATH")))
+
+
+def _content(models_dir, logger):
+    from content import ContentModel, ContentStrategy
+    return ContentStrategy(ContentModel.load(
+        _model_path(models_dir, "content.bin", "CONTENT_MODEL_PATH")))
+
+
+def _ann(models_dir, logger):
+    from ann import ANNStrategy, IVFIndex
+    return ANNStrategy(IVFIndex.load(
+        _model_path(models_dir, "ann.bin", "ANN_INDEX_PATH"),
+        int(os.environ.get("ANN_NPROBE", "8"))))
+
+
+def _precomputed(models_dir, logger):
+    from precomputed import PrecomputedStrategy, PrecomputedTable
+    return PrecomputedStrategy(PrecomputedTable.load(
+        _model_path(models_dir, "precomputed.bin", "PRECOMPUTED_TABLE_PATH")))
+
+
+STRATEGIES = {
+    "random": _random,
+    "category": _category,
+    "popularity": _popularity,
+    "trending": _trending,
+    "cooccurrence": _cooccurrence,
+    "content": _content,
+    "ann": _ann,
+    "precomputed": _precomputed,
+}
+
+
+def build(name, models_dir=None, logger=None):
+    """Builds strategy `name`, loading its model from models_dir if given."""
+    try:
+        factory = STRATEGIES[name]
+    except KeyError:
+        raise ValueError("unknown recommendation strategy: " + name)
+    return factory(models_dir, logger)
+
+
+def build_split(arms, models_dir=None, logger=None):
+    """Builds a TrafficSplit from parse_split() output."""
+    version = os.path.basename(os.path.normpath(models_dir)) if models_dir else None
+    return TrafficSplit([
+        Arm(name, build(name, models_dir, logger), weight, logger) for name, weight in arms], version)
+
+
+def from_environment(logger):
+    """Returns a holder whose acquire() yields the TrafficSplit for one request.
+
+    With RECOMMENDATION_ARTIFACT_DIR set, models are loaded from the active
+    artifact version and hot-swapped when a new version is published.
+    """
+    arms = parse_split(os.environ.get("RECOMMENDATION_STRATEGIES", "") or
+                       os.environ.get("RECOMMENDATION_STRATEGY", "random"))
+    artifact_dir = os.environ.get("RECOMMENDATION_ARTIFACT_DIR", "")
+    if not artifact_dir:
+        return StrategyHolder(build_split(arms, logger=logger))
+
+    from artifacts import ArtifactStore
+    store = ArtifactStore(
+        artifact_dir, lambda models_dir: build_split(arms, models_dir, logger), logger,
+        float(os.environ.get("ARTIFACT_POLL_INTERVAL_SECONDS", "30")))
+    store.start()
+    return store
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import demo_pb2
+from ann import ANNStrategy
+from catalog import CatalogSnapshot
+from content import ContentStrategy
+from cooccurrence import CooccurrenceStrategy
+from precomputed import PrecomputedStrategy
+from trending import TrendingStrategy
+
+
+class ScoredModel(object):
+    """Scores "gone" and then p9..p0, as any of the strategies' models."""
+
+    def __init__(self):
+        self.calls = []
+
+    def top_k(self, product_ids, n):
+        self.calls.append(n)
+        scored = [("gone", 100.0)] + [("p{}".format(i), float(i)) for i in range(9, -1, -1)]
+        return [(p, s) for p, s in scored if p not in product_ids][:n]
+
+    def top(self, n, excluded=()):
+        return self.top_k(excluded, n)
+
+
+@pytest.mark.parametrize("strategy_class", [
+    ANNStrategy, ContentStrategy, CooccurrenceStrategy, PrecomputedStrategy, TrendingStrategy])
+def test_scored_strategies_drop_products_missing_from_the_catalog(strategy_class):
+    snapshot = CatalogSnapshot([demo_pb2.Product(id="p{}".format(i)) for i in range(10)])
+    model = ScoredModel()
+    strategy = strategy_class(model)
+
+    assert strategy.recommend(snapshot, ["p9"], 3) == ["p8", "p7", "p6"]
+    assert model.calls == [6]
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Trending products from a decayed count-min sketch.
+
+Product events (views, add-to-carts, purchases) are counted approximately in
+a fixed-size count-min sketch, so memory stays bounded however many SKUs
+there are. All counters decay exponentially on a timer, which makes counts
+favour recent activity. A top-k heap tracks the current heavy hitters.
+
+Events are read by tailing a local JSON lines file (TRENDING_EVENTS_PATH),
+one {"product_id": "...", "weight": 1.0} object or bare product id per line.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from strategies import ScoredStrategy
+
+
+class DecayedCountMinSketch(object):
+    def __init__(self, width=1 << 16, depth=4):
+        self.width = width
+        self.depth = depth
+        self.counts = np.zeros((depth, width), dtype=np.float32)
+        self._rows = np.arange(depth)
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return np.array([(h1 + i * h2) % self.width for i in range(self.depth)])
+
+    def add(self, key, weight=1.0):
+        """Adds weight to key and returns its new estimated count."""
+        columns = self._columns(key)
+        self.counts[self._rows, columns] += weight
+        return float(self.counts[self._rows, columns].min())
+
+    def estimate(self, key):
+        return float(self.counts[self._rows, self._columns(key)].min())
+
+    def decay(self, factor):
+        self.counts *= factor
+
+
+class TrendingCounter(object):
+    """A decayed sketch plus the top-k keys by estimated count."""
+
+    # counts change with every event and differ between replicas
+    deterministic = False
+
+    def __init__(self, capacity=100, width=1 << 16, depth=4, half_life=3600):
+        if capacity < 1:
+            raise ValueError("trending top-k capacity must be at least 1")
+        self._capacity = capacity
+        self._half_life = half_life
+        self._sketch = DecayedCountMinSketch(width, depth)
+        self._lock = threading.Lock()
+        self._top = {}  # key -> estimated count
+        self._heap = []  # (count, key), may hold stale entries
+        self._decayed_at = time.monotonic()
+        self.version = 0
+
+    def add(self, key, weight=1.0):
+        with self._lock:
+            count = self._sketch.add(key, weight)
+            if key in self._top or len(self._top) < self._capacity:
+                self._top[key] = count
+                heapq.heappush(self._heap, (count, key))
+                if len(self._heap) > 2 * self._capacity:
+                    self._compact()
+                return
+            smallest = self._smallest()
+            if smallest is None:
+                # every entry was stale; the top-k is full, so rebuilding
+                # from it leaves a current smallest
+                self._compact()
+                smallest = self._heap[0]
+            if count > smallest[0]:
+                heapq.heappop(self._heap)
+                del self._top[smallest[1]]
+                self._top[key] = count
+                heapq.heappush(self._heap, (count, key))
+
+    def _compact(self):
+        # updates of keys already in the top-k leave stale entries behind;
+        # rebuilding keeps the heap within twice the capacity
+        self._heap = [(count, key) for key, count in self._top.items()]
+        heapq.heapify(self._heap)
+
+    def _smallest(self):
+        """Returns the lowest current (count, key), or None if the heap ran dry."""
+        # drop heap entries superseded by a later update
+        heap = self._heap
+        while heap and (heap[0][1] not in self._top or self._top[heap[0][1]] != heap[0][0]):
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def decay(self):
+        """Applies the decay accrued since the last call."""
+        now = time.monotonic()
+        with self._lock:
+            factor = math.pow(0.5, (now - self._decayed_at) / self._half_life)
+            self._decayed_at = now
+            self._sketch.decay(factor)
+            self._top = {key: count * factor for key, count in self._top.items()}
+            self._compact()
+            self.version += 1
+
+    def top(self, k, excluded=()):
+        """Returns up to k (key, count) pairs, highest first."""
+        with self._lock:
+            items = list(self._top.items())
+        excluded = set(excluded)
+        return heapq.nlargest(
+            k, ((key, count) for key, count in items if key not in excluded),
+            key=lambda item: item[1])
+
+    def current(self):
+        """Weights source for PopularityStrategy: changes once per decay tick.
+
+        The returned dict is live; readers only look keys up in it.
+        """
+        return self.version, self._top
+
+
+def _parse_event(line):
+    line = line.strip()
+    if not line:
+        return None, 0
+    if line.startswith("{"):
+        event = json.loads(line)
+        return event.get("product_id"), float(event.get("weight", 1.0))
+    return line, 1.0
+
+
+class EventFileTail(object):
+    """Feeds new lines of an events file to a TrendingCounter.
+
+    Starts at the end of the file and reopens it when it is rotated or
+    truncated.
+    """
+
+    def __init__(self, path, counter, logger=None, poll_interval=1.0):
+        self._path = path
+        self._counter = counter
+        self._logger = logger
+        self._poll_interval = poll_interval
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="trending-tail", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _open(self, seek_end):
+        f = open(self._path, "rb")
+        if seek_end:
+            f.seek(0, os.SEEK_END)
+        return f, os.fstat(f.fileno()).st_ino
+
+    def _run(self):
+        f = None
+        inode = None
+        while not self._stopped.is_set():
+            if f is None:
+                try:
+                    f, inode = self._open(seek_end=inode is None)
+                except OSError:
+                    self._stopped.wait(self._poll_interval)
+                    continue
+            line = f.readline()
+            if line.endswith(b"\n"):
+                try:
+                    key, weight = _parse_event(line.decode("utf-8"))
+                    if key:
+                        self._counter.add(key, weight)
+                except (ValueError, AttributeError, UnicodeDecodeError) as exc:
+                    if self._logger is not None:
+                        self._logger.warning("Skipping bad trending event: " + str(exc))
+                continue
+            if line:
+                # partial line: rewind and wait for the writer to finish it
+                f.seek(-len(line), os.SEEK_CUR)
+            self._stopped.wait(self._poll_interval)
+            try:
+                stat = os.stat(self._path)
+                if stat.st_ino != inode or stat.st_size < f.tell():
+                    f.close()
+                    f = None
+            except OSError:
+                pass
+
+
+class TrendingStrategy(ScoredStrategy):
+    name = "trending"
+    deterministic = False
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def candidates(self, product_ids, n):
+        return self.counter.top(n, product_ids)
+
+
+_shared_counter = None
+_shared_lock = threading.Lock()
+
+
+def shared_counter(logger=None):
+    """Returns the process-wide counter, starting its feed on first use."""
+    global _shared_counter
+    with _shared_lock:
+        if _shared_counter is None:
+            counter = TrendingCounter(
+                int(os.environ.get("TRENDING_TOP_K", "100")),
+                int(os.environ.get("TRENDING_SKETCH_WIDTH", str(1 << 16))),
+                int(os.environ.get("TRENDING_SKETCH_DEPTH", "4")),
+                float(os.environ.get("TRENDING_HALF_LIFE_SECONDS", "3600")))
+            EventFileTail(os.environ["TRENDING_EVENTS_PATH"], counter, logger).start()
+            interval = float(os.environ.get("TRENDING_DECAY_INTERVAL_SECONDS", "60"))
+
+            def decay():
+                while True:
+                    time.sleep(interval)
+                    counter.decay()
+
+            threading.Thread(target=decay, name="trending-decay", daemon=True).start()
+            _shared_counter = counter
+        return _shared_counter
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from trending import DecayedCountMinSketch, TrendingCounter
+
+
+def test_count_min_sketch_never_underestimates():
+    sketch = DecayedCountMinSketch(width=64, depth=4)
+    counts = {"p{}".format(i): i % 7 + 1 for i in range(200)}
+    for key, count in counts.items():
+        sketch.add(key, count)
+    for key, count in counts.items():
+        assert sketch.estimate(key) >= count
+    # wide enough that most keys are exact
+    wide = DecayedCountMinSketch(width=1 << 16, depth=4)
+    for key, count in counts.items():
+        wide.add(key, count)
+    assert sum(wide.estimate(k) == c for k, c in counts.items()) > 190
+
+
+def test_decay_scales_every_count():
+    sketch = DecayedCountMinSketch(width=1 << 10)
+    sketch.add("a", 8)
+    sketch.decay(0.25)
+    assert sketch.estimate("a") == pytest.approx(2)
+
+
+def test_counter_keeps_the_heaviest_keys():
+    counter = TrendingCounter(capacity=3, width=1 << 12)
+    for key, weight in [("a", 1), ("b", 5), ("c", 2), ("d", 9), ("e", 3), ("a", 1)]:
+        counter.add(key, weight)
+    assert [key for key, _ in counter.top(3)] == ["d", "b", "e"]
+    assert [key for key, _ in counter.top(2, excluded=["d"])] == ["b", "e"]
+    assert len(counter._heap) <= 6
+
+
+def test_counter_decay_keeps_ranking_and_bumps_version():
+    counter = TrendingCounter(capacity=2, width=1 << 12, half_life=3600)
+    counter.add("a", 4)
+    counter.add("b", 2)
+    version = counter.version
+    counter.decay()
+    assert counter.version == version + 1
+    assert [key for key, _ in counter.top(2)] == ["a", "b"]
+
+
+def test_counter_rejects_empty_top_k():
+    with pytest.raises(ValueError):
+        TrendingCounter(capacity=0)
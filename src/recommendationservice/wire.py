@@ -0,0 +1,88 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-serialized RecommendationService responses.
+
+The RecommendationService handlers return wire-format bytes, and are
+registered with an identity response serializer, so a response is
+serialized once when it is computed and cached results are sent as they
+are. A batch response is the concatenation of its items' encodings, each
+framed as field 1 of ListRecommendationsBatchResponse.
+"""
+
+import collections
+
+import grpc
+
+import demo_pb2
+
+SERVICE = "hipstershop.RecommendationService"
+
+# tag of ListRecommendationsBatchResponse.responses: field 1, length-delimited
+_RESPONSES_TAG = b"\x0a"
+
+
+class Recommendation(collections.namedtuple("Recommendation", "payload product_ids")):
+    """A serialized ListRecommendationsResponse and the ids it holds."""
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, product_ids):
+        product_ids = tuple(product_ids)
+        response = demo_pb2.ListRecommendationsResponse(product_ids=product_ids)
+        return cls(response.SerializeToString(), product_ids)
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_batch(payloads):
+    """Returns a serialized ListRecommendationsBatchResponse of `payloads`."""
+    parts = []
+    for payload in payloads:
+        parts.append(_RESPONSES_TAG)
+        parts.append(_varint(len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def _identity(payload):
+    return payload
+
+
+def add_RecommendationServiceServicer_to_server(servicer, server):
+    """Like demo_pb2_grpc's, for a servicer whose handlers return bytes."""
+    rpc_method_handlers = {
+        'ListRecommendations': grpc.unary_unary_rpc_method_handler(
+            servicer.ListRecommendations,
+            request_deserializer=demo_pb2.ListRecommendationsRequest.FromString,
+            response_serializer=_identity,
+        ),
+        'ListRecommendationsBatch': grpc.unary_unary_rpc_method_handler(
+            servicer.ListRecommendationsBatch,
+            request_deserializer=demo_pb2.ListRecommendationsBatchRequest.FromString,
+            response_serializer=_identity,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(SERVICE, rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
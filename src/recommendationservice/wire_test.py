@@ -0,0 +1,41 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import demo_pb2
+import wire
+
+
+def response(n, length=10):
+    return demo_pb2.ListRecommendationsResponse(
+        product_ids=["{:0{}d}".format(i, length) for i in range(n)])
+
+
+def test_recommendation_payload_is_the_serialized_response():
+    recommendation = wire.Recommendation.of(["a", "b"])
+    assert recommendation.payload == demo_pb2.ListRecommendationsResponse(
+        product_ids=["a", "b"]).SerializeToString()
+    assert recommendation.product_ids == ("a", "b")
+
+
+# empty, one-byte and multi-byte length prefixes
+@pytest.mark.parametrize("responses", [
+    [], [response(0)], [response(5), response(0), response(1)], [response(20, 10)]])
+def test_encode_batch_matches_protobuf(responses):
+    encoded = wire.encode_batch(r.SerializeToString() for r in responses)
+    expected = demo_pb2.ListRecommendationsBatchResponse(responses=responses)
+    assert encoded == expected.SerializeToString()